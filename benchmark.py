@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Sync benchmarks against the in-memory fake Drive.
+
+Builds a synthetic vault (local tree + Drive tree), then measures a first
+sync, a no-op sync and an incremental sync after churning files on both sides.
+Results are written as JSON so runs can be compared across commits.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import resource
+import threading
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import google_drive_sync
+from fake_drive import FakeDrive
+from google_drive_sync import GoogleDriveSync
+from metadata_store import SqliteMetadataStore
+
+
+PAGE_SIZE_KB = os.sysconf('SC_PAGE_SIZE') // 1024 if hasattr(os, 'sysconf') else 4
+
+
+def current_rss_kb() -> int:
+    """Resident set size right now (ru_maxrss, the process-wide peak, without /proc)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE_KB
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class ThreadSampler:
+    """Samples the thread count and resident memory in the background to report their peaks.
+
+    ru_maxrss is the peak over the whole process, so it would carry earlier
+    phases and vault sizes over; sampling keeps the RSS peak per phase.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.peak_rss_kb = current_rss_kb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.peak = max(self.peak, threading.active_count())
+        self.peak_rss_kb = max(self.peak_rss_kb, current_rss_kb())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def folder_paths(depth: int, fanout: int) -> List[str]:
+    """Relative folder paths of a tree with the given depth and fan-out ('' is the root)."""
+    paths = ['']
+    level = ['']
+    for _ in range(depth):
+        level = [os.path.join(parent, f"dir{i}") if parent else f"dir{i}"
+                 for parent in level for i in range(fanout)]
+        paths.extend(level)
+    return paths
+
+
+def file_size(rng: random.Random, args) -> int:
+    """Mostly small notes, with a fraction of large attachments."""
+    if rng.random() < args.large_fraction:
+        return int(rng.uniform(0.5, 1.5) * args.large_size)
+    return max(1, int(rng.lognormvariate(0, 1) * args.mean_size))
+
+
+def build_vault(root: str, drive: FakeDrive, drive_root_id: str, num_files: int,
+                rng: random.Random, args) -> Tuple[List[str], Dict[str, str]]:
+    """Create num_files files split between the local tree and the fake Drive tree.
+
+    Returns (local relative paths, Drive relative path -> file ID).
+    """
+    folders = folder_paths(args.depth, args.fanout)
+    drive_folder_ids = {'': drive_root_id}
+    for path in folders[1:]:
+        parent, name = os.path.split(path)
+        drive_folder_ids[path] = drive.add_folder(name, drive_folder_ids[parent])
+
+    local_files = []
+    drive_files = {}
+    for i in range(num_files):
+        folder = folders[i % len(folders)]
+        rel_path = os.path.join(folder, f"note{i}.md") if folder else f"note{i}.md"
+        content = rng.randbytes(file_size(rng, args))
+        if rng.random() < args.remote_fraction:
+            drive_files[rel_path] = drive.add_file(os.path.basename(rel_path), drive_folder_ids[folder], content)
+        else:
+            full_path = os.path.join(root, rel_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as f:
+                f.write(content)
+            local_files.append(rel_path)
+    return local_files, drive_files
+
+
+def churn(root: str, drive: FakeDrive, local_files: List[str], drive_files: Dict[str, str],
+          rng: random.Random, args):
+    """Modify args.churn of the files, split evenly between local and Drive edits."""
+    count = int((len(local_files) + len(drive_files)) * args.churn)
+    time.sleep(0.01)  # Make sure new local mtimes differ
+    for rel_path in rng.sample(local_files, min(len(local_files), count // 2)):
+        with open(os.path.join(root, rel_path), 'ab') as f:
+            f.write(rng.randbytes(16))
+    for rel_path in rng.sample(sorted(drive_files), min(len(drive_files), count - count // 2)):
+        drive.modify_file(drive_files[rel_path], rng.randbytes(file_size(rng, args)))
+
+
+def measure(name: str, sync: GoogleDriveSync, drive: FakeDrive) -> Dict:
+    """Run one sync cycle and collect its cost."""
+    drive.reset_stats()
+    with ThreadSampler() as sampler, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        sync.sync()
+        elapsed = time.perf_counter() - start
+    stats = drive.stats()
+    result = {
+        'phase': name,
+        'wall_time_s': round(elapsed, 4),
+        'api_calls': stats['calls'],
+        'api_calls_total': sum(stats['calls'].values()),
+        'bytes_uploaded': stats.get('bytes_uploaded', 0),
+        'bytes_downloaded': stats.get('bytes_downloaded', 0),
+        'peak_rss_kb': sampler.peak_rss_kb,
+        'peak_threads': sampler.peak,
+        'drive_clients_built': sync.clients_built,
+    }
+    print(f"  {name:<12} {result['wall_time_s']:>9.3f}s  {result['api_calls_total']:>7} calls  "
+          f"↑{result['bytes_uploaded']:>12} B  ↓{result['bytes_downloaded']:>12} B  "
+          f"{result['peak_threads']:>3} threads")
+    return result
+
+
+def run_benchmark(num_files: int, args) -> Dict:
+    rng = random.Random(args.seed)
+    drive = FakeDrive(latency=args.latency, page_size=args.page_size, seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix='drivesync-bench-') as tmp:
+        local_folder = os.path.join(tmp, 'vault')
+        os.makedirs(local_folder)
+        store = SqliteMetadataStore(os.path.join(tmp, 'sync_metadata.db'))
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            sync = GoogleDriveSync(local_folder=local_folder, service_factory=drive.service,
+                                   metadata_store=store)
+        try:
+            local_files, drive_files = build_vault(local_folder, drive, sync.drive_root_id, num_files, rng, args)
+            print(f"\n📦 {num_files} files ({len(local_files)} local, {len(drive_files)} on Drive)")
+            phases = [
+                measure('first', sync, drive),
+                measure('noop', sync, drive),
+            ]
+            churn(local_folder, drive, local_files, drive_files, rng, args)
+            phases.append(measure('incremental', sync, drive))
+        finally:
+            sync.close()
+    return {'files': num_files, 'phases': phases}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync cycles against an in-memory fake Drive')
+    parser.add_argument('--files', type=int, nargs='+', default=[1000],
+                        help='Vault sizes to benchmark (default: 1000; e.g. --files 1000 10000 100000)')
+    parser.add_argument('--depth', type=int, default=3, help='Folder tree depth (default: 3)')
+    parser.add_argument('--fanout', type=int, default=4, help='Subfolders per folder (default: 4)')
+    parser.add_argument('--mean-size', type=int, default=2048, help='Typical note size in bytes (default: 2048)')
+    parser.add_argument('--large-fraction', type=float, default=0.02,
+                        help='Fraction of large attachments (default: 0.02)')
+    parser.add_argument('--large-size', type=int, default=1024 * 1024,
+                        help='Typical attachment size in bytes (default: 1 MiB)')
+    parser.add_argument('--remote-fraction', type=float, default=0.2,
+                        help='Fraction of files that start on Drive only (default: 0.2)')
+    parser.add_argument('--churn', type=float, default=0.01,
+                        help='Fraction of files modified before the incremental sync (default: 0.01)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Fake API latency in seconds (default: 0)')
+    parser.add_argument('--page-size', type=int, default=100, help='Fake Drive page size (default: 100)')
+    parser.add_argument('--max-qps', type=float, default=google_drive_sync.API_MAX_QPS,
+                        help=f'API rate limit used by the sync (default: {google_drive_sync.API_MAX_QPS})')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', default='bench_output.json', help='JSON results file')
+    args = parser.parse_args()
+    google_drive_sync.API_MAX_QPS = args.max_qps
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': [run_benchmark(num_files, args) for num_files in args.files],
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📝 Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
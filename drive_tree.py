@@ -0,0 +1,58 @@
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+
+class DriveTree:
+    """In-memory model of the Drive versions the local folder is in sync with.
+
+    The model lives for the daemon's lifetime and is fed directly by transfer
+    responses: each upload records the version it produced, each download
+    (or a remote change found to match local content) the version it
+    applied. reconcile() compares scanned or changed files against it, so
+    only versions the local side has not seen go on to planning. Versions
+    our own uploads produced are counted as echoes when Drive reports them
+    back. Reported changes are never recorded here by themselves, so a
+    download that fails is reported and retried again next cycle.
+    """
+
+    def __init__(self):
+        self._files: Dict[str, Dict] = {}  # file_id -> {'path', 'mtime', 'own'}
+        self._lock = threading.Lock()
+
+    def record_upload(self, rel_path: str, file: Dict):
+        """Apply an upload response (id, modifiedTime) and expect its echo."""
+        with self._lock:
+            self._store(rel_path, file['id'], file.get('modifiedTime'), own=True)
+
+    def record_download(self, rel_path: str, file_id: str, mtime: Optional[str]):
+        """Record a Drive version that is now present locally."""
+        with self._lock:
+            self._store(rel_path, file_id, mtime, own=False)
+
+    def reconcile(self, drive_files: Dict[str, Dict]) -> Tuple[Dict[str, Dict], int]:
+        """Drop the versions the local side already has from scanned or changed files.
+
+        drive_files maps relative path -> file info (id, mtime, md5, size,
+        name); a scan may pass it in parts as folders are listed. Returns
+        (remote changes, number of echoes of our own writes dropped).
+        """
+        remote = {}
+        echoes = 0
+        with self._lock:
+            for rel_path, info in drive_files.items():
+                known = self._files.get(info['id'])
+                if known is None or known['path'] != rel_path or known['mtime'] != info.get('mtime'):
+                    remote[rel_path] = info
+                    continue
+                if known['own']:
+                    echoes += 1
+                    known['own'] = False  # Count each echo once
+        return remote, echoes
+
+    def retain(self, file_ids: Set[str]):
+        """After a complete scan, forget files it no longer contains."""
+        with self._lock:
+            self._files = {file_id: known for file_id, known in self._files.items() if file_id in file_ids}
+
+    def _store(self, rel_path: str, file_id: str, mtime: Optional[str], own: bool):
+        self._files[file_id] = {'path': rel_path, 'mtime': mtime, 'own': own}
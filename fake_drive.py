@@ -0,0 +1,597 @@
+"""
+In-memory fake of the Google Drive v3 API subset used by GoogleDriveSync.
+
+Usage:
+    drive = FakeDrive(latency=0.005, page_size=100)
+    store = SqliteMetadataStore(os.path.join(tmp_dir, 'sync_metadata.db'))
+    sync = GoogleDriveSync(local_folder=vault_dir, service_factory=drive.service, metadata_store=store)
+
+Supports files().list/get/create/update/copy/get_media/generateIds, changes().getStartPageToken/list,
+batch requests, pagination, resumable upload sessions (next_chunk, status
+queries, expiry), per-call latency and error injection (HttpError
+429/500/404/...). Counters in drive.stats() report calls per endpoint (items
+sent inside a batch are counted as "<endpoint> (batched)", session chunks and
+status queries as "upload.chunk" / "upload.status") and bytes moved.
+"""
+import re
+import json
+import random
+import hashlib
+import itertools
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httplib2
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUploadProgress
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+MEDIA_URI_PREFIX = 'https://fake-drive.invalid/drive/v3/files/'
+UPLOAD_URI_PREFIX = 'https://fake-drive.invalid/upload/drive/v3/files?upload_id='
+MAX_BATCH_SIZE = 100  # Drive rejects larger batches
+
+
+def _http_error(status: int, message: str = '', uri: str = None, headers: Dict = None) -> HttpError:
+    info = {'status': str(status)}
+    info.update(headers or {})
+    content = ('{"error": {"code": %d, "message": "%s"}}' % (status, message)).encode()
+    return HttpError(httplib2.Response(info), content, uri=uri)
+
+
+class _QueryParser:
+    """Parser for the Drive query language subset GoogleDriveSync emits.
+
+    Supports and/or/not, parentheses, ``name``/``mimeType`` (=, !=),
+    ``trashed`` (=, !=) and ``'<id>' in parents``.
+    """
+
+    TOKEN = re.compile(r"\s*(\(|\)|'(?:[^'\\]|\\.)*'|!=|=|[A-Za-z]+)")
+
+    def __init__(self, query: str):
+        self.tokens = []
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            match = self.TOKEN.match(query, pos)
+            if not match:
+                raise _http_error(400, f"Invalid query: {query}")
+            self.tokens.append(match.group(1))
+            pos = match.end()
+        self.pos = 0
+
+    def parse(self) -> Callable[[Dict], bool]:
+        predicate = self._or()
+        if self.pos != len(self.tokens):
+            raise _http_error(400, 'Invalid query')
+        return predicate
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _take(self) -> str:
+        token = self._peek()
+        if token is None:
+            raise _http_error(400, 'Invalid query')
+        self.pos += 1
+        return token
+
+    def _or(self):
+        terms = [self._and()]
+        while self._peek() == 'or':
+            self._take()
+            terms.append(self._and())
+        return terms[0] if len(terms) == 1 else (lambda f: any(t(f) for t in terms))
+
+    def _and(self):
+        terms = [self._not()]
+        while self._peek() == 'and':
+            self._take()
+            terms.append(self._not())
+        return terms[0] if len(terms) == 1 else (lambda f: all(t(f) for t in terms))
+
+    def _not(self):
+        if self._peek() == 'not':
+            self._take()
+            term = self._not()
+            return lambda f: not term(f)
+        return self._atom()
+
+    @staticmethod
+    def _string(token: str) -> str:
+        if not (token.startswith("'") and token.endswith("'")):
+            raise _http_error(400, f"Expected string, got {token}")
+        return re.sub(r"\\(.)", r"\1", token[1:-1])
+
+    def _atom(self):
+        token = self._take()
+        if token == '(':
+            term = self._or()
+            if self._take() != ')':
+                raise _http_error(400, 'Unbalanced parentheses')
+            return term
+        if token.startswith("'"):
+            value = self._string(token)
+            if self._take() != 'in' or self._take() != 'parents':
+                raise _http_error(400, 'Only "in parents" is supported')
+            return lambda f: value in f.get('parents', [])
+        field, op = token, self._take()
+        if op not in ('=', '!='):
+            raise _http_error(400, f"Unsupported operator {op}")
+        if field == 'trashed':
+            value = self._take() == 'true'
+            getter = lambda f: f['trashed']
+        elif field in ('name', 'mimeType'):
+            value = self._string(self._take())
+            getter = lambda f: f[field]
+        else:
+            raise _http_error(400, f"Unsupported field {field}")
+        if op == '=':
+            return lambda f: getter(f) == value
+        return lambda f: getter(f) != value
+
+
+class FakeRequest:
+    """Stand-in for googleapiclient.http.HttpRequest.
+
+    Requests with resumable media also support next_chunk(): the first call
+    opens an upload session (resumable_uri), later calls PUT one chunk each
+    through http. Setting resumable_uri/resumable_progress resumes a session.
+    """
+
+    def __init__(self, drive: 'FakeDrive', endpoint: str, handler: Callable[[], Dict],
+                 media_body=None, finish: Callable[[bytes], Dict] = None):
+        self._drive = drive
+        self.endpoint = endpoint
+        self._handler = handler
+        self.resumable = media_body if media_body is not None and media_body.resumable() else None
+        self._finish = finish
+        self.http = FakeHttp(drive)
+        self.resumable_uri = None
+        self.resumable_progress = 0
+
+    def execute(self, num_retries: int = 0):
+        self._drive._before_call(self.endpoint)
+        return self._handler()
+
+    def next_chunk(self, http=None, num_retries: int = 0):
+        size = self.resumable.size()
+        if self.resumable_uri is None:
+            self._drive._before_call(self.endpoint)
+            self.resumable_uri = self._drive._open_upload_session(size, self._finish)
+        data = self.resumable.getbytes(self.resumable_progress, self.resumable.chunksize())
+        end = self.resumable_progress + len(data) - 1
+        resp, content = self.http.request(self.resumable_uri, method='PUT', body=data, headers={
+            'Content-Range': f'bytes {self.resumable_progress}-{end}/{size}',
+            'Content-Length': str(len(data)),
+        })
+        if resp.status in (200, 201):
+            return None, json.loads(content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=self.resumable_uri)
+        self.resumable_progress = int(resp['range'].rsplit('-', 1)[1]) + 1 if 'range' in resp else 0
+        return MediaUploadProgress(self.resumable_progress, size), None
+
+    def _execute_in_batch(self):
+        self._drive._before_call(self.endpoint, batched=True)
+        return self._handler()
+
+
+class FakeBatch:
+    """Stand-in for BatchHttpRequest: one round trip, per-item callbacks and errors."""
+
+    def __init__(self, drive: 'FakeDrive', callback: Callable = None):
+        self._drive = drive
+        self._callback = callback
+        self._items = []
+
+    def add(self, request: FakeRequest, callback: Callable = None, request_id: str = None):
+        request_id = request_id if request_id is not None else str(len(self._items) + 1)
+        self._items.append((request_id, request, callback or self._callback))
+
+    def execute(self, http=None, num_retries: int = 0):
+        if len(self._items) > MAX_BATCH_SIZE:
+            raise _http_error(400, f"Too many requests in batch ({len(self._items)} > {MAX_BATCH_SIZE})")
+        self._drive._before_call('batch')
+        for request_id, request, callback in self._items:
+            try:
+                response, exception = request._execute_in_batch(), None
+            except HttpError as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeHttp:
+    """Serves get_media downloads (with Range support) and upload session PUTs."""
+
+    def __init__(self, drive: 'FakeDrive'):
+        self._drive = drive
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if uri.startswith(UPLOAD_URI_PREFIX):
+            return self._drive._upload_request(uri, body or b'', headers or {})
+        file_id = urlparse(uri).path.rsplit('/', 1)[-1]
+        self._drive._before_call('files.get_media', uri=uri)
+        with self._drive._lock:
+            file = self._drive._get_live(file_id, uri=uri)
+            content = file['content']
+        total = len(content)
+        range_header = (headers or {}).get('range')
+        if not range_header:
+            self._drive._count_bytes('bytes_downloaded', total)
+            return httplib2.Response({'status': '200', 'content-length': str(total)}), content
+        start, _, end = range_header.split('=', 1)[1].partition('-')
+        start = int(start)
+        end = min(int(end) if end else total - 1, total - 1)
+        if start >= total and total:
+            return httplib2.Response({'status': '416', 'content-range': f'bytes */{total}'}), b''
+        chunk = content[start:end + 1]
+        self._drive._count_bytes('bytes_downloaded', len(chunk))
+        return httplib2.Response({
+            'status': '206',
+            'content-range': f'bytes {start}-{start + len(chunk) - 1}/{total}',
+            'content-length': str(len(chunk)),
+        }), chunk
+
+
+class FakeMediaRequest:
+    """What files().get_media() returns; MediaIoBaseDownload reads http/uri/headers."""
+
+    def __init__(self, drive: 'FakeDrive', file_id: str):
+        self.http = FakeHttp(drive)
+        self.uri = f'{MEDIA_URI_PREFIX}{file_id}?alt=media'
+        self.headers = {}
+
+
+class FakeFilesResource:
+    def __init__(self, drive: 'FakeDrive'):
+        self._drive = drive
+
+    def list(self, q: str = None, spaces: str = 'drive', fields: str = None,
+             pageToken: str = None, pageSize: int = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.list',
+                           lambda: self._drive._list(q, pageToken, pageSize))
+
+    def get(self, fileId: str, fields: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.get', lambda: self._drive._get(fileId))
+
+    def create(self, body: Dict = None, media_body=None, fields: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.create',
+                           lambda: self._drive._create(body or {}, media_body), media_body,
+                           lambda content: self._drive._create_file(body or {}, content))
+
+    def update(self, fileId: str, body: Dict = None, media_body=None, fields: str = None,
+               addParents: str = None, removeParents: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.update',
+                           lambda: self._drive._update(fileId, body or {}, media_body, addParents, removeParents),
+                           media_body,
+                           lambda content: self._drive._update_file(fileId, body or {}, content,
+                                                                    addParents, removeParents))
+
+    def copy(self, fileId: str, body: Dict = None, fields: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.copy', lambda: self._drive._copy(fileId, body or {}))
+
+    def generateIds(self, count: int = 10, space: str = 'drive', **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'files.generateIds', lambda: self._drive._generate_ids(count))
+
+    def get_media(self, fileId: str, **kwargs) -> FakeMediaRequest:
+        return FakeMediaRequest(self._drive, fileId)
+
+
+class FakeChangesResource:
+    def __init__(self, drive: 'FakeDrive'):
+        self._drive = drive
+
+    def getStartPageToken(self, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'changes.getStartPageToken',
+                           lambda: {'startPageToken': str(self._drive._change_seq)})
+
+    def list(self, pageToken: str, pageSize: int = None, includeRemoved: bool = True,
+             spaces: str = 'drive', fields: str = None, **kwargs) -> FakeRequest:
+        return FakeRequest(self._drive, 'changes.list',
+                           lambda: self._drive._list_changes(pageToken, pageSize, includeRemoved))
+
+
+class FakeDriveService:
+    """Per-thread 'client' handed out by FakeDrive.service()."""
+
+    def __init__(self, drive: 'FakeDrive'):
+        self._drive = drive
+
+    def files(self) -> FakeFilesResource:
+        return FakeFilesResource(self._drive)
+
+    def changes(self) -> FakeChangesResource:
+        return FakeChangesResource(self._drive)
+
+    def new_batch_http_request(self, callback: Callable = None) -> FakeBatch:
+        return FakeBatch(self._drive, callback)
+
+
+class FakeDrive:
+    """Shared in-memory Drive state.
+
+    Args:
+        latency: Seconds slept before every API call (simulates round trips)
+        page_size: Default (and maximum) items per files.list / changes.list page
+        error_rate: Probability that a call fails with a random status from error_statuses
+        error_statuses: Statuses used for random failures
+        seed: Seed for the random error generator, for deterministic runs
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 100, error_rate: float = 0.0,
+                 error_statuses=(429, 500), seed: int = 0):
+        self.latency = latency
+        self.page_size = page_size
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._files: Dict[str, Dict] = {}
+        self._changes: List[str] = []  # file IDs in change order; token = index
+        self._change_seq = 1
+        self._ids = itertools.count(1)
+        self._clock = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        self._injected: Dict[str, deque] = {}
+        self._upload_sessions: Dict[str, Dict] = {}  # upload_id -> {'size', 'data', 'finish', 'result'}
+        self._upload_ids = itertools.count(1)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.root_id = 'root'
+        self._files[self.root_id] = {
+            'id': self.root_id, 'name': 'My Drive', 'mimeType': FOLDER_MIME_TYPE,
+            'parents': [], 'trashed': False, 'modifiedTime': self._now(), 'content': b'',
+        }
+
+    # --- client side ---
+
+    def service(self) -> FakeDriveService:
+        """Service factory for GoogleDriveSync(service_factory=drive.service)."""
+        return FakeDriveService(self)
+
+    def inject_error(self, endpoint: str, status: int, count: int = 1, retry_after: float = None):
+        """Make the next ``count`` calls to endpoint (e.g. 'files.create') fail with status."""
+        headers = {'retry-after': str(retry_after)} if retry_after is not None else None
+        with self._lock:
+            self._injected.setdefault(endpoint, deque()).extend([(status, headers)] * count)
+
+    def stats(self) -> Dict:
+        """Calls per endpoint plus byte counters."""
+        with self._lock:
+            return {'calls': dict(self.calls), **dict(self.counters)}
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls.clear()
+            self.counters.clear()
+
+    # --- test-side helpers that bypass the API (no latency, no counters) ---
+
+    def expire_upload_sessions(self):
+        """Drop every open upload session, as Drive does after a week."""
+        with self._lock:
+            self._upload_sessions.clear()
+
+    def add_folder(self, name: str, parent_id: str = None) -> str:
+        with self._lock:
+            return self._insert({'name': name, 'mimeType': FOLDER_MIME_TYPE,
+                                 'parents': [parent_id or self.root_id]}, b'')
+
+    def add_file(self, name: str, parent_id: str, content: bytes = b'',
+                 mime_type: str = 'application/octet-stream') -> str:
+        with self._lock:
+            return self._insert({'name': name, 'mimeType': mime_type, 'parents': [parent_id]}, content)
+
+    def modify_file(self, file_id: str, content: bytes):
+        with self._lock:
+            self._set_content(self._files[file_id], content)
+            self._touch(self._files[file_id])
+
+    def trash(self, file_id: str):
+        with self._lock:
+            self._files[file_id]['trashed'] = True
+            self._touch(self._files[file_id])
+
+    def file(self, file_id: str) -> Dict:
+        with self._lock:
+            return dict(self._files[file_id])
+
+    def find(self, name: str, parent_id: str = None) -> Optional[Dict]:
+        with self._lock:
+            for file in self._files.values():
+                if file['name'] == name and not file['trashed'] and (
+                        parent_id is None or parent_id in file['parents']):
+                    return dict(file)
+        return None
+
+    # --- internals ---
+
+    def _before_call(self, endpoint: str, uri: str = None, batched: bool = False):
+        with self._lock:
+            self.calls[f"{endpoint} (batched)" if batched else endpoint] += 1
+            queued = self._injected.get(endpoint)
+            injected = queued.popleft() if queued else None
+            if injected is None and self.error_rate and self._random.random() < self.error_rate:
+                injected = (self._random.choice(self.error_statuses), None)
+        if self.latency and not batched:
+            time.sleep(self.latency)
+        if injected is not None:
+            status, headers = injected
+            raise _http_error(status, f"Injected error on {endpoint}", uri=uri, headers=headers)
+
+    def _count_bytes(self, counter: str, amount: int):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def _now(self) -> str:
+        # Deterministic, strictly increasing modifiedTime values
+        self._clock += timedelta(milliseconds=1)
+        return self._clock.strftime('%Y-%m-%dT%H:%M:%S.') + f"{self._clock.microsecond // 1000:03d}Z"
+
+    def _public(self, file: Dict) -> Dict:
+        result = {key: value for key, value in file.items() if key != 'content'}
+        if file['mimeType'] == FOLDER_MIME_TYPE:
+            result.pop('md5Checksum', None)
+            result.pop('size', None)
+        return result
+
+    def _get_live(self, file_id: str, uri: str = None) -> Dict:
+        file = self._files.get(file_id)
+        if file is None:
+            raise _http_error(404, f"File not found: {file_id}", uri=uri)
+        return file
+
+    def _set_content(self, file: Dict, content: bytes):
+        file['content'] = content
+        file['size'] = str(len(content))
+        file['md5Checksum'] = hashlib.md5(content).hexdigest()
+
+    def _touch(self, file: Dict):
+        file['modifiedTime'] = self._now()
+        self._changes.append(file['id'])
+        self._change_seq += 1
+
+    def _insert(self, body: Dict, content: bytes, file_id: str = None) -> str:
+        if file_id is not None and file_id in self._files:
+            raise _http_error(409, f"A file already exists with the provided ID: {file_id}")
+        file_id = file_id or f"fake{next(self._ids):08d}"
+        for parent_id in body.get('parents', []):
+            parent = self._get_live(parent_id)
+            if parent['mimeType'] != FOLDER_MIME_TYPE:
+                raise _http_error(400, f"Parent is not a folder: {parent_id}")
+        file = {
+            'id': file_id,
+            'name': body.get('name', 'Untitled'),
+            'mimeType': body.get('mimeType', 'application/octet-stream'),
+            'parents': list(body.get('parents') or [self.root_id]),
+            'trashed': False,
+        }
+        self._set_content(file, content)
+        self._files[file_id] = file
+        self._touch(file)
+        return file_id
+
+    @staticmethod
+    def _media_bytes(media_body) -> bytes:
+        return media_body.getbytes(0, media_body.size()) if media_body is not None else b''
+
+    def _list(self, q: Optional[str], page_token: Optional[str], page_size: Optional[int]) -> Dict:
+        predicate = _QueryParser(q).parse() if q else (lambda f: True)
+        size = min(page_size or self.page_size, self.page_size)
+        offset = int(page_token) if page_token else 0
+        with self._lock:
+            matches = [f for f in self._files.values() if f['id'] != self.root_id and predicate(f)]
+            page = [self._public(f) for f in matches[offset:offset + size]]
+        result = {'files': page}
+        if offset + size < len(matches):
+            result['nextPageToken'] = str(offset + size)
+        return result
+
+    def _generate_ids(self, count: int) -> Dict:
+        if not 1 <= count <= 1000:
+            raise _http_error(400, f"Invalid count: {count}")
+        with self._lock:
+            return {'kind': 'drive#generatedIds', 'space': 'drive',
+                    'ids': [f"gen{next(self._ids):08d}" for _ in range(count)]}
+
+    def _get(self, file_id: str) -> Dict:
+        with self._lock:
+            return self._public(self._get_live(file_id))
+
+    def _create(self, body: Dict, media_body) -> Dict:
+        content = self._media_bytes(media_body)
+        self._count_bytes('bytes_uploaded', len(content))
+        return self._create_file(body, content)
+
+    def _create_file(self, body: Dict, content: bytes) -> Dict:
+        with self._lock:
+            file_id = self._insert(body, content, file_id=body.get('id'))
+            return self._public(self._files[file_id])
+
+    def _copy(self, file_id: str, body: Dict) -> Dict:
+        # Server-side: the content never crosses the wire, so no bytes are counted
+        with self._lock:
+            source = self._get_live(file_id)
+            copy_body = {'name': source['name'], 'mimeType': source['mimeType'],
+                         'parents': source['parents'], **body}
+            new_id = self._insert(copy_body, source['content'], file_id=body.get('id'))
+            return self._public(self._files[new_id])
+
+    def _update(self, file_id: str, body: Dict, media_body, add_parents: str, remove_parents: str) -> Dict:
+        content = self._media_bytes(media_body) if media_body is not None else None
+        if content is not None:
+            self._count_bytes('bytes_uploaded', len(content))
+        return self._update_file(file_id, body, content, add_parents, remove_parents)
+
+    def _update_file(self, file_id: str, body: Dict, content: Optional[bytes],
+                     add_parents: str, remove_parents: str) -> Dict:
+        with self._lock:
+            file = self._get_live(file_id)
+            if 'name' in body:
+                file['name'] = body['name']
+            if 'trashed' in body:
+                file['trashed'] = body['trashed']
+            if remove_parents:
+                file['parents'] = [p for p in file['parents'] if p not in remove_parents.split(',')]
+            if add_parents:
+                for parent_id in add_parents.split(','):
+                    self._get_live(parent_id)
+                    file['parents'].append(parent_id)
+            if content is not None:
+                self._set_content(file, content)
+            self._touch(file)
+            return self._public(file)
+
+    def _open_upload_session(self, size: int, finish: Callable[[bytes], Dict]) -> str:
+        with self._lock:
+            upload_id = f"up{next(self._upload_ids):08d}"
+            self._upload_sessions[upload_id] = {'size': size, 'data': bytearray(), 'finish': finish, 'result': None}
+        return UPLOAD_URI_PREFIX + upload_id
+
+    def _upload_request(self, uri: str, body: bytes, headers: Dict):
+        """PUT to a session URI: 'bytes */N' asks for the committed offset, 'bytes a-b/N' sends a chunk."""
+        content_range = {k.lower(): v for k, v in headers.items()}.get('content-range', '')
+        is_status = content_range.startswith('bytes */')
+        self._before_call('upload.status' if is_status else 'upload.chunk', uri=uri)
+        with self._lock:
+            session = self._upload_sessions.get(uri[len(UPLOAD_URI_PREFIX):])
+            if session is None:
+                return httplib2.Response({'status': '404'}), b'{"error": {"code": 404, "message": "Upload session not found"}}'
+            if session['result'] is None and not is_status:
+                start = int(content_range.split(' ', 1)[1].split('-', 1)[0])
+                if start == len(session['data']):
+                    session['data'].extend(body)
+                    self._count_bytes('bytes_uploaded', len(body))
+                    if len(session['data']) >= session['size']:
+                        session['result'] = session['finish'](bytes(session['data']))
+            if session['result'] is not None:
+                return httplib2.Response({'status': '200'}), json.dumps(session['result']).encode()
+            committed = len(session['data'])
+        headers = {'status': '308'}
+        if committed:
+            headers['range'] = f'bytes=0-{committed - 1}'
+        return httplib2.Response(headers), b''
+
+    def _list_changes(self, page_token: str, page_size: Optional[int], include_removed: bool) -> Dict:
+        size = min(page_size or self.page_size, self.page_size)
+        with self._lock:
+            try:
+                start = int(page_token)
+            except (TypeError, ValueError):
+                raise _http_error(400, f"Invalid pageToken: {page_token}")
+            if not 1 <= start <= self._change_seq:
+                raise _http_error(400, f"Invalid pageToken: {page_token}")
+            ids = self._changes[start - 1:start - 1 + size]
+            changes = [{'fileId': fid, 'removed': False, 'file': self._public(self._files[fid])}
+                       for fid in ids]
+            end = start + len(ids)
+            result = {'changes': changes}
+            if end < self._change_seq:
+                result['nextPageToken'] = str(end)
+            else:
+                result['newStartPageToken'] = str(self._change_seq)
+            return result
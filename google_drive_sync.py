@@ -1,17 +1,25 @@
 import os
-import json
 import time
+import stat
+import queue
 import pickle
+import json
+import hashlib
 import threading
-import io
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+from drive_tree import DriveTree
+from local_watcher import LocalWatcher
+from rate_limiter import AdaptiveRateLimiter
+from metadata_store import MetadataStore, open_metadata_store
 
 # --- CONFIGURATION ---
 LOCAL_FOLDER = "/home/aritrarc1/GDrive"
@@ -19,29 +27,108 @@ SCOPES = ['https://www.googleapis.com/auth/drive']
 CREDS_FILE = 'secrets/client_secret_116989766183-v0e50u650rdhah0j933fsloke77hp1od.apps.googleusercontent.com.json'
 TOKEN_FILE = 'token.pickle'
 METADATA_FILE = 'sync_metadata.json'
+METADATA_DB = 'sync_metadata.db'
+METADATA_BACKEND = 'sqlite'  # 'sqlite' (incremental, WAL) or 'json' (whole file per save)
 DRIVE_FOLDER_NAME = 'Obsidian'  # Root folder name in Google Drive
-MAX_WORKERS = 10  # Max parallel threads for API calls (tune to avoid rate limits)
+MAX_WORKERS = 10  # Max parallel threads; the rate limiter adapts API concurrency below this
+API_MAX_QPS = 20.0  # Upper bound for Drive API queries per second
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Bytes per ranged download request (held in memory per worker)
+PARALLEL_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024  # Larger files download as concurrent byte ranges
+PARALLEL_DOWNLOAD_STREAMS = 4  # Concurrent ranges per large file
+DOWNLOAD_MAX_ATTEMPTS = 5  # Cycles a failing download is retried before it is given up
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024  # Smaller files upload in one multipart request
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Resumable upload chunk (multiple of 256 KiB); progress is saved per chunk
+UPLOAD_SESSION_TTL = 6 * 24 * 3600  # Seconds a saved upload session is trusted (Drive keeps them a week)
+GENERATE_IDS_BATCH = 1000  # Max IDs per files.generateIds call
+ID_POOL_REFILL = 100  # IDs reserved at a time when the pool runs dry outside a batch
+BATCH_SIZE = 100  # Max requests per Drive batch HTTP call
+MAX_FOLDERS_PER_QUERY = 50  # Folders listed together with one OR'd parents query
+MAX_QUERY_LENGTH = 2000  # Characters; keeps OR'd queries well under Drive's URL limits
+DRIVE_SCAN_MODE = 'auto'  # Full scans: 'crawl' (per folder), 'flat' (whole account) or 'auto'
+FLAT_SCAN_PAGE_SIZE = 1000  # Items per page when listing the whole account
+PIPELINE_DEPTH = 2 * MAX_WORKERS  # Hashes and transfers queued on the worker pool at once
+PIPELINE_QUEUE_SIZE = 1000  # Remote changes the Drive scan may run ahead of the planner
+TEMP_SUFFIX = '.drivesync-tmp'  # In-progress downloads, never uploaded
+DRIVE_ITEM_FIELDS = 'id, name, mimeType, modifiedTime, md5Checksum, size, parents'  # Requested by every scan
+
+class LocalStat(NamedTuple):
+    """What the sync needs to know about a local file, from a single stat."""
+    size: int
+    mtime: float
+    mtime_ns: int
+    inode: int
+    
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> 'LocalStat':
+        return cls(st.st_size, st.st_mtime, st.st_mtime_ns, st.st_ino)
+
 
 class GoogleDriveSync:
     """Bidirectional Google Drive sync with interval-based syncing."""
     
-    def __init__(self, sync_interval: int = 300):
+    def __init__(self, sync_interval: int = 300, local_folder: str = LOCAL_FOLDER,
+                 service_factory: Optional[Callable[[], Any]] = None,
+                 metadata_store: Optional[MetadataStore] = None):
         """
         Initialize the sync service.
         
         Args:
             sync_interval: Time in seconds between sync operations (default: 300 = 5 minutes)
+            local_folder: Local directory to sync (default: LOCAL_FOLDER)
+            service_factory: Callable returning a new Drive service object; defaults to
+                building the real Drive v3 client with OAuth credentials (see fake_drive.py)
+            metadata_store: Metadata backend; defaults to the one selected by METADATA_BACKEND.
+                Required with a service_factory, so a test or benchmark never opens (or
+                migrates, or overwrites) the real sync metadata in the working directory
         """
+        if service_factory is not None and metadata_store is None:
+            raise ValueError("A custom service_factory needs an explicit metadata_store")
         self.sync_interval = sync_interval
-        self.creds = self._get_credentials()
-        self.service = build('drive', 'v3', credentials=self.creds)
+        self.local_folder = local_folder
+        if service_factory is None:
+            self.creds = self._get_credentials()
+            service_factory = lambda: build('drive', 'v3', credentials=self.creds)
+        self._service_factory = service_factory
+        self._store = metadata_store
+        self.clients_built = 0  # Drive clients constructed over the daemon's lifetime
+        self._clients_lock = threading.Lock()
+        self.service = self._build_service()
+        self._limiter = AdaptiveRateLimiter(API_MAX_QPS, MAX_WORKERS)  # Every API call goes through this
         self._thread_local = threading.local()  # Thread-local service objects
+        self._thread_local.service = self.service  # Main thread reuses the first client
+        # One pool for the daemon's lifetime so worker threads keep their warm clients
+        self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='drive-sync')
         self.drive_root_id = self._get_or_create_drive_folder()
         self.metadata = self._load_metadata()
         self._metadata_lock = threading.Lock()  # Protects self.metadata in threads
+        self._upload_modes = Counter()  # Upload requests per mode in the current cycle
+        self._id_pool = deque()  # Reserved Drive IDs for creates
+        self._id_lock = threading.Lock()
+        self._drive_tree = DriveTree()  # Drive versions the local folder is in sync with
+        # md5 -> paths of synced files with that content, for server-side copies of duplicates
+        self._content_index = {}
+        for rel_path, entry in self.metadata['files'].items():
+            if entry.get('md5') and entry.get('drive_id'):
+                self._content_index.setdefault(entry['md5'], set()).add(rel_path)
+        self._bytes_saved = 0  # Upload bytes avoided by copies in the current cycle
+        # (inode, size, mtime_ns) -> md5 of local content, seeded from metadata
+        self._hash_cache = {
+            (entry['inode'], entry['size'], entry['mtime_ns']): entry['md5']
+            for entry in self.metadata['files'].values()
+            if entry.get('md5') and 'mtime_ns' in entry
+        }
         
         # Ensure local folder exists
-        os.makedirs(LOCAL_FOLDER, exist_ok=True)
+        os.makedirs(self.local_folder, exist_ok=True)
+        
+        # Relative path -> LocalStat for every local file, shared by both phases
+        # and patched as transfers complete (None until the first walk)
+        self._local_snapshot: Optional[Dict[str, LocalStat]] = None
+        
+        # Track local changes between cycles (None -> full walk every cycle)
+        self._watcher = LocalWatcher(self.local_folder)
+        if not self._watcher.start():
+            self._watcher = None
         
     def _get_credentials(self):
         """Get or refresh OAuth credentials."""
@@ -74,21 +161,36 @@ class GoogleDriveSync:
         
         return creds
     
+    def _build_service(self):
+        """Build a Drive client and count it."""
+        service = self._service_factory()
+        with self._clients_lock:
+            self.clients_built += 1
+        return service
+    
     def _get_thread_service(self):
-        """Get a thread-local Google Drive service (httplib2 is NOT thread-safe)."""
+        """Get a thread-local Google Drive service (httplib2 is NOT thread-safe).
+        
+        Worker threads live as long as self._executor, so each one builds its
+        client (and opens its connection) once and reuses it every cycle.
+        """
         if not hasattr(self._thread_local, 'service'):
-            self._thread_local.service = build('drive', 'v3', credentials=self.creds)
+            self._thread_local.service = self._build_service()
         return self._thread_local.service
     
+    def _execute(self, request):
+        """Execute a Drive API request through the adaptive rate limiter."""
+        return self._limiter.call(request.execute)
+    
     def _get_or_create_drive_folder(self) -> str:
         """Get or create the root sync folder in Google Drive."""
         # Search for existing folder
         query = f"name='{DRIVE_FOLDER_NAME}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = self.service.files().list(
+        results = self._execute(self.service.files().list(
             q=query,
             spaces='drive',
             fields='files(id, name)'
-        ).execute()
+        ))
         
         files = results.get('files', [])
         
@@ -102,33 +204,80 @@ class GoogleDriveSync:
             'name': DRIVE_FOLDER_NAME,
             'mimeType': 'application/vnd.google-apps.folder'
         }
-        folder = self.service.files().create(
+        folder = self._execute(self.service.files().create(
             body=file_metadata,
             fields='id'
-        ).execute()
+        ))
         folder_id = folder['id']
         print(f"📁 Created new Drive folder: {DRIVE_FOLDER_NAME} (ID: {folder_id})")
         return folder_id
     
     def _load_metadata(self) -> Dict:
-        """Load sync metadata from file."""
-        if os.path.exists(METADATA_FILE):
-            try:
-                with open(METADATA_FILE, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                print("⚠️  Metadata file corrupted, starting fresh")
-                return {'files': {}, 'drive_files': {}}
-        return {'files': {}, 'drive_files': {}}
+        """Open the metadata store and load sync metadata from it."""
+        if self._store is None:
+            self._store = open_metadata_store(METADATA_BACKEND, METADATA_FILE, METADATA_DB)
+        return self._store.load()
     
     def _save_metadata(self):
-        """Save sync metadata to file."""
-        with open(METADATA_FILE, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+        """Save sync metadata (per-file entries are already written as they change)."""
+        with self._metadata_lock:
+            self._store.save(self.metadata)
+    
+    def _record_file(self, rel_path: str, entry: Dict):
+        """Store the metadata entry for a synced file (thread-safe)."""
+        with self._metadata_lock:
+            previous = self.metadata['files'].get(rel_path)
+            self.metadata['files'][rel_path] = entry
+            if previous and previous.get('md5') != entry.get('md5'):
+                paths = self._content_index.get(previous.get('md5'))
+                if paths is not None:
+                    paths.discard(rel_path)
+                    if not paths:
+                        del self._content_index[previous['md5']]
+            if entry.get('md5') and entry.get('drive_id'):
+                self._content_index.setdefault(entry['md5'], set()).add(rel_path)
+        self._store.put_file(rel_path, entry)
+    
+    def _duplicate_source(self, md5: str) -> Optional[str]:
+        """Drive ID of a synced file whose content has this md5, if any."""
+        with self._metadata_lock:
+            for rel_path in self._content_index.get(md5, ()):
+                entry = self.metadata['files'][rel_path]
+                if entry.get('md5') == md5 and entry.get('drive_id'):
+                    return entry['drive_id']
+        return None
+    
+    def _file_entry(self, st: os.stat_result, drive_id: str, drive_mtime: str, md5: Optional[str]) -> Dict:
+        """Build a metadata entry for a local file and remember its hash."""
+        if md5:
+            self._hash_cache[(st.st_ino, st.st_size, st.st_mtime_ns)] = md5
+        return {
+            'mtime': st.st_mtime,
+            'drive_id': drive_id,
+            'drive_mtime': drive_mtime,
+            'md5': md5,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'inode': st.st_ino
+        }
+    
+    def _hash_local_file(self, local_path: str) -> Tuple[os.stat_result, str]:
+        """Return (stat, md5) for a local file, reading it only on a cache miss."""
+        st = os.stat(local_path)
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        md5 = self._hash_cache.get(key)
+        if md5 is None:
+            digest = hashlib.md5()
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            md5 = digest.hexdigest()
+            self._hash_cache[key] = md5
+        return st, md5
     
     def _get_relative_path(self, full_path: str) -> str:
-        """Get path relative to LOCAL_FOLDER."""
-        return os.path.relpath(full_path, LOCAL_FOLDER)
+        """Get path relative to the local sync folder."""
+        return os.path.relpath(full_path, self.local_folder)
     
     def _get_drive_path(self, local_rel_path: str) -> List[str]:
         """Convert local relative path to Drive folder hierarchy."""
@@ -137,279 +286,1496 @@ class GoogleDriveSync:
         parts = Path(local_rel_path).parts
         return list(parts[:-1])  # Exclude filename
     
-    def _get_or_create_drive_folder_path(self, folder_path: List[str]) -> str:
-        """Get or create nested folders in Drive, return final folder ID."""
+    def _run_batch(self, requests: List[Tuple[str, Callable[[Any], Any]]]) -> Dict[str, Tuple[Any, Optional[Exception]]]:
+        """Send up to BATCH_SIZE requests in one batch HTTP call.
+        
+        Returns key -> (response, exception) from the per-item callbacks.
+        """
+        service = self._get_thread_service()
+        outcomes = {}
+        
+        def callback(request_id, response, exception):
+            outcomes[requests[int(request_id)][0]] = (response, exception)
+        
+        batch = service.new_batch_http_request(callback=callback)
+        for index, (key, make_request) in enumerate(requests):
+            batch.add(make_request(service), request_id=str(index))
+        self._execute(batch)
+        return outcomes
+    
+    def _execute_batch(self, requests: Dict[str, Callable[[Any], Any]]) -> Dict[str, Any]:
+        """Run metadata-only requests through the Drive batch endpoint.
+        
+        requests maps a key to a function building the request from a service.
+        Batches of BATCH_SIZE are sent in parallel; items that fail with a
+        retryable error are retried in a later round with backoff. Returns
+        key -> response, or key -> exception for items that failed for good.
+        """
+        results = {}
+        pending = dict(requests)
+        attempt = 0
+        while pending:
+            items = list(pending.items())
+            futures = [
+                self._executor.submit(self._run_batch, items[i:i + BATCH_SIZE])
+                for i in range(0, len(items), BATCH_SIZE)
+            ]
+            retry = {}
+            retry_after = None
+            for future in futures:
+                for key, (response, exception) in future.result().items():
+                    if exception is None:
+                        results[key] = response
+                        continue
+                    retryable, throttled, after = self._limiter.classify(exception)
+                    if throttled:
+                        self._limiter.throttle()
+                    if retryable and attempt < self._limiter.max_retries:
+                        retry[key] = pending[key]
+                        if after is not None:
+                            retry_after = max(retry_after or 0, after)
+                    else:
+                        results[key] = exception
+            pending = retry
+            if pending:
+                time.sleep(self._limiter.backoff_delay(attempt, retry_after))
+                attempt += 1
+        return results
+    
+    def _reserve_drive_ids(self, count: int) -> List[str]:
+        """Reserve count file IDs with files.generateIds (at most 1000 per call)."""
+        service = self._get_thread_service()
+        ids = []
+        while len(ids) < count:
+            response = self._execute(service.files().generateIds(
+                count=min(GENERATE_IDS_BATCH, count - len(ids)),
+                space='drive'
+            ))
+            ids.extend(response['ids'])
+        return ids
+    
+    def _fill_id_pool(self, count: int):
+        """Make sure at least count reserved IDs are pooled, with as few calls as possible."""
+        with self._id_lock:
+            missing = count - len(self._id_pool)
+            if missing > 0:
+                self._id_pool.extend(self._reserve_drive_ids(missing))
+    
+    def _next_drive_id(self) -> str:
+        """Take one reserved ID for a create, refilling the pool when empty."""
+        with self._id_lock:
+            if not self._id_pool:
+                self._id_pool.extend(self._reserve_drive_ids(ID_POOL_REFILL))
+            return self._id_pool.popleft()
+    
+    def _find_drive_folder(self, folder_name: str, parent_id: str) -> Optional[str]:
+        """Return the ID of folder_name inside parent_id, or None."""
+        service = self._get_thread_service()
+        query = f"name='{folder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+        results = self._execute(service.files().list(
+            q=query,
+            spaces='drive',
+            fields='files(id, name)'
+        ))
+        files = results.get('files', [])
+        return files[0]['id'] if files else None
+    
+    def _create_drive_folder(self, folder_name: str, parent_id: str) -> str:
+        """Create a folder under parent_id with a pre-generated ID.
+        
+        The ID makes the limiter's retries of this call idempotent: if an
+        earlier attempt already created the folder, Drive answers 409 and we
+        just reuse it. A create that fails outright and is retried in a later
+        cycle takes a new ID from the pool, so it is only protected by the
+        lookup _get_or_create_drive_folder_path does first.
+        """
         service = self._get_thread_service()
+        folder_id = self._next_drive_id()
+        file_metadata = {
+            'id': folder_id,
+            'name': folder_name,
+            'mimeType': 'application/vnd.google-apps.folder',
+            'parents': [parent_id]
+        }
+        try:
+            self._execute(service.files().create(
+                body=file_metadata,
+                fields='id'
+            ))
+        except HttpError as e:
+            if e.resp.status != 409:
+                raise
+        return folder_id
+    
+    def _get_or_create_drive_folder_path(self, folder_path: List[str]) -> str:
+        """Get or create nested folders in Drive, return final folder ID.
+        
+        Starts from the deepest folder already in the path -> ID cache
+        (metadata['drive_folders']) and only queries Drive for the rest.
+        """
         parent_id = self.drive_root_id
+        start = 0
         
-        for folder_name in folder_path:
-            # Search for folder
-            query = f"name='{folder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            results = service.files().list(
-                q=query,
-                spaces='drive',
-                fields='files(id, name)'
-            ).execute()
-            
-            files = results.get('files', [])
+        with self._metadata_lock:
+            folders = self.metadata.setdefault('drive_folders', {})
+            for depth in range(len(folder_path), 0, -1):
+                cached_id = folders.get(os.path.join(*folder_path[:depth]))
+                if cached_id:
+                    parent_id = cached_id
+                    start = depth
+                    break
+        
+        for depth in range(start, len(folder_path)):
+            folder_name = folder_path[depth]
+            parent_id = (self._find_drive_folder(folder_name, parent_id)
+                         or self._create_drive_folder(folder_name, parent_id))
             
-            if files:
-                parent_id = files[0]['id']
-            else:
-                # Create folder
-                file_metadata = {
-                    'name': folder_name,
-                    'mimeType': 'application/vnd.google-apps.folder',
-                    'parents': [parent_id]
-                }
-                folder = service.files().create(
-                    body=file_metadata,
-                    fields='id'
-                ).execute()
-                parent_id = folder['id']
+            with self._metadata_lock:
+                self.metadata['drive_folders'][os.path.join(*folder_path[:depth + 1])] = parent_id
         
         return parent_id
     
-    def _upload_file(self, local_path: str):
-        """Upload a file to Google Drive."""
-        rel_path = self._get_relative_path(local_path)
+    def _prepare_drive_folders(self, folder_paths: Set[str]) -> Set[str]:
+        """Make sure every folder in folder_paths (and its ancestors) exists on Drive.
+        
+        Folders missing from the cache are looked up one depth level at a time
+        in batch requests. Once a folder is known not to exist, its whole
+        subtree is new: IDs for all new folders are reserved in bulk, then each
+        level is created with batched creates. Returns the relative paths of
+        created folders.
+        """
+        needed = set()
+        for path in folder_paths:
+            while path and path not in needed:
+                needed.add(path)
+                path = os.path.dirname(path)
+        
+        with self._metadata_lock:
+            folders = dict(self.metadata.setdefault('drive_folders', {}))
+        
+        def parent_id_of(path: str) -> str:
+            parent = os.path.dirname(path)
+            return folders[parent] if parent else self.drive_root_id
+        
+        by_depth = {}
+        for path in needed - folders.keys():
+            by_depth.setdefault(len(Path(path).parts), []).append(path)
+        
+        # Look up unknown folders whose parent exists; children of new folders are new too
+        new_folders = set()
+        for depth in sorted(by_depth):
+            lookups = []
+            for path in by_depth[depth]:
+                if os.path.dirname(path) in new_folders:
+                    new_folders.add(path)
+                else:
+                    lookups.append(path)
+            results = self._execute_batch({
+                path: lambda service, name=os.path.basename(path), parent_id=parent_id_of(path):
+                    service.files().list(
+                        q=f"name='{name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false",
+                        spaces='drive',
+                        fields='files(id, name)'
+                    )
+                for path in lookups
+            })
+            for path, result in results.items():
+                if isinstance(result, Exception):
+                    raise result
+                if result.get('files'):
+                    folders[path] = result['files'][0]['id']
+                else:
+                    new_folders.add(path)
+        
+        if new_folders:
+            ordered = sorted(new_folders, key=lambda p: len(Path(p).parts))
+            folders.update(zip(ordered, self._reserve_drive_ids(len(ordered))))
+            print(f"📁 Creating {len(ordered)} folder(s) on Drive...")
+            for depth in sorted({len(Path(p).parts) for p in ordered}):
+                results = self._execute_batch({
+                    path: lambda service, name=os.path.basename(path), parent_id=parent_id_of(path), folder_id=folders[path]:
+                        service.files().create(
+                            body={
+                                'id': folder_id,
+                                'name': name,
+                                'mimeType': 'application/vnd.google-apps.folder',
+                                'parents': [parent_id]
+                            },
+                            fields='id'
+                        )
+                    for path in ordered if len(Path(path).parts) == depth
+                })
+                for result in results.values():
+                    # 409: an earlier attempt already created it with the reserved ID
+                    if isinstance(result, HttpError) and result.resp.status == 409:
+                        continue
+                    if isinstance(result, Exception):
+                        raise result
+        
+        with self._metadata_lock:
+            self.metadata['drive_folders'].update({path: folders[path] for path in needed})
+        return new_folders
+    
+    def _merge_drive_folders(self, before: Dict[str, str], after: Dict[str, str]):
+        """Apply a scan's view of the folder map (path -> ID) on top of the live one.
+        
+        before is the map the scan started from. Folders created by uploads
+        while the scan ran are kept; only entries the scan saw change are
+        touched.
+        """
+        with self._metadata_lock:
+            folders = self.metadata.setdefault('drive_folders', {})
+            for path, folder_id in before.items():
+                if path not in after and folders.get(path) == folder_id:
+                    del folders[path]
+            folders.update(after)
+    
+    def _forget_drive_folder_path(self, folder_path: List[str]):
+        """Drop cached IDs for every folder along folder_path (e.g. after a 404)."""
+        with self._metadata_lock:
+            folders = self.metadata.setdefault('drive_folders', {})
+            for depth in range(1, len(folder_path) + 1):
+                folders.pop(os.path.join(*folder_path[:depth]), None)
+    
+    def _upload_to_folder(self, local_path: str, rel_path: str, parent_id: str,
+                          known_new: bool = False, md5: Optional[str] = None) -> Tuple[Dict, bool]:
+        """Create or update local_path inside the Drive folder parent_id.
+        
+        known_new skips the existence lookup (the parent folder was just created).
+        A new file whose md5 matches a file already synced is created with
+        files.copy instead of uploading its bytes. Returns (file, copied).
+        """
+        service = self._get_thread_service()
         file_name = os.path.basename(local_path)
         
-        try:
-            service = self._get_thread_service()
-            
-            # Get modification time
-            mtime = os.path.getmtime(local_path)
-            
-            # Get or create parent folder in Drive
-            folder_path = self._get_drive_path(rel_path)
-            parent_id = self._get_or_create_drive_folder_path(folder_path)
-            
+        files = []
+        if not known_new:
             # Check if file already exists in Drive
             query = f"name='{file_name}' and '{parent_id}' in parents and trashed=false"
-            results = service.files().list(
+            results = self._execute(service.files().list(
                 q=query,
                 spaces='drive',
                 fields='files(id, name, modifiedTime)'
-            ).execute()
-            
+            ))
             files = results.get('files', [])
+        
+        if not files and md5:
+            file = self._copy_duplicate(local_path, parent_id, md5)
+            if file is not None:
+                if file.get('md5Checksum') == md5:
+                    print(f"♻️  Copied on Drive: {rel_path}")
+                    return file, True
+                # The source changed on Drive since we synced it: upload into the copy
+                return self._update_drive_file(local_path, rel_path, file['id']), False
+        
+        media = self._media_upload(local_path)
+        
+        if files:
+            # Update existing file
+            file_id = files[0]['id']
+            file = self._execute_upload(service.files().update(
+                fileId=file_id,
+                media_body=media,
+                fields='id, modifiedTime, md5Checksum'
+            ), local_path, rel_path, file_id)
+            print(f"📤 Updated: {rel_path}")
+        else:
+            # Create new file with a reserved ID so a retried create cannot duplicate it;
+            # an interrupted resumable create keeps the ID its saved session was opened with
+            with self._metadata_lock:
+                session = self.metadata.get('upload_sessions', {}).get(rel_path)
+            file_id = session['file_id'] if session else self._next_drive_id()
+            file_metadata = {'id': file_id, 'name': file_name, 'parents': [parent_id]}
+            try:
+                file = self._execute_upload(service.files().create(
+                    body=file_metadata,
+                    media_body=media,
+                    fields='id, modifiedTime, md5Checksum'
+                ), local_path, rel_path, file_id)
+            except HttpError as e:
+                if e.resp.status != 409:
+                    raise
+                # An earlier attempt already created it
+                file = self._execute(service.files().get(
+                    fileId=file_id,
+                    fields='id, modifiedTime, md5Checksum'
+                ))
+            print(f"📤 Uploaded: {rel_path}")
+        
+        return file, False
+    
+    def _copy_duplicate(self, local_path: str, parent_id: str, md5: str) -> Optional[Dict]:
+        """Create local_path in parent_id as a server-side copy of a synced file with this md5.
+        
+        Returns the copy, or None if there is no such file on Drive.
+        """
+        source_id = self._duplicate_source(md5)
+        if source_id is None:
+            return None
+        service = self._get_thread_service()
+        file_id = self._next_drive_id()
+        try:
+            file = self._execute(service.files().copy(
+                fileId=source_id,
+                body={'id': file_id, 'name': os.path.basename(local_path), 'parents': [parent_id]},
+                fields='id, modifiedTime, md5Checksum'
+            ))
+        except HttpError as e:
+            if e.resp.status == 404:
+                return None  # Source is gone; upload the bytes
+            if e.resp.status != 409:
+                raise
+            # An earlier attempt already created it
+            file = self._execute(service.files().get(
+                fileId=file_id,
+                fields='id, modifiedTime, md5Checksum'
+            ))
+        return file
+    
+    @staticmethod
+    def _upload_mode(size: int) -> str:
+        """'multipart' (single request) for small files, 'resumable' session for large ones."""
+        return 'resumable' if size >= RESUMABLE_THRESHOLD else 'multipart'
+    
+    def _media_upload(self, local_path: str) -> MediaFileUpload:
+        """Media body for local_path using the upload mode that fits its size."""
+        if self._upload_mode(os.path.getsize(local_path)) == 'resumable':
+            return MediaFileUpload(local_path, resumable=True, chunksize=UPLOAD_CHUNK_SIZE)
+        return MediaFileUpload(local_path, resumable=False)
+    
+    def _pending_upload(self, rel_path: str, st: os.stat_result) -> Optional[Dict]:
+        """Saved upload session for rel_path, if it is fresh and the source is unchanged."""
+        with self._metadata_lock:
+            session = self.metadata.get('upload_sessions', {}).get(rel_path)
+        if session is None:
+            return None
+        if (session['expires'] < time.time()
+                or (session['inode'], session['size'], session['mtime_ns']) != (st.st_ino, st.st_size, st.st_mtime_ns)):
+            print(f"🗑️  Discarding stale upload session for {rel_path}")
+            self._drop_upload_session(rel_path)
+            return None
+        return session
+    
+    def _save_upload_session(self, rel_path: str, session: Dict):
+        with self._metadata_lock:
+            sessions = self.metadata.setdefault('upload_sessions', {})
+            sessions[rel_path] = session
+            self._store.put_state('upload_sessions', dict(sessions))
+    
+    def _drop_upload_session(self, rel_path: str):
+        with self._metadata_lock:
+            sessions = self.metadata.setdefault('upload_sessions', {})
+            if sessions.pop(rel_path, None) is not None:
+                self._store.put_state('upload_sessions', dict(sessions))
+    
+    def _prune_upload_sessions(self):
+        """Forget saved sessions whose local file is gone or changed."""
+        with self._metadata_lock:
+            sessions = dict(self.metadata.get('upload_sessions', {}))
+        for rel_path, session in sessions.items():
+            local_stat = self._local_snapshot.get(rel_path)
+            if (local_stat is None or session['expires'] < time.time()
+                    or (local_stat.inode, local_stat.size, local_stat.mtime_ns)
+                    != (session['inode'], session['size'], session['mtime_ns'])):
+                self._drop_upload_session(rel_path)
+    
+    def _query_upload_offset(self, http, uri: str, size: int) -> Optional[int]:
+        """Bytes an upload session has committed (size if it completed), or None if it is gone."""
+        def query():
+            resp, content = http.request(uri, method='PUT', headers={
+                'Content-Length': '0',
+                'Content-Range': f'bytes */{size}',
+            })
+            if resp.status == 429 or resp.status >= 500:
+                raise HttpError(resp, content, uri=uri)
+            return resp
+        try:
+            resp = self._limiter.call(query)
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                return None
+            raise
+        if resp.status in (200, 201):
+            return size
+        if resp.status == 308:
+            # Range: bytes=0-<last committed byte>; absent if nothing arrived yet
+            return int(resp['range'].rsplit('-', 1)[1]) + 1 if 'range' in resp else 0
+        return None
+    
+    def _execute_upload(self, request, local_path: str, rel_path: str, file_id: str) -> Dict:
+        """Execute a create/update request that carries local_path as media.
+        
+        Resumable uploads are sent chunk by chunk and their session (URI,
+        committed offset, source inode/size/mtime_ns, expiry) is saved after
+        every chunk. A later attempt for the same path and Drive ID asks the
+        session how far it got and continues from there.
+        """
+        if getattr(request, 'resumable', None) is None:
+            return self._execute(request)
+        
+        st = os.stat(local_path)
+        session = self._pending_upload(rel_path, st)
+        if session is not None and session['file_id'] != file_id:
+            self._drop_upload_session(rel_path)
+            session = None
+        if session is not None:
+            offset = self._query_upload_offset(request.http, session['uri'], st.st_size)
+            if offset is None:
+                print(f"🗑️  Upload session for {rel_path} expired, starting over")
+                self._drop_upload_session(rel_path)
+            elif offset >= st.st_size:
+                # Finished before we could record it
+                self._drop_upload_session(rel_path)
+                return self._execute(self._get_thread_service().files().get(
+                    fileId=file_id, fields='id, modifiedTime, md5Checksum, trashed'))
+            else:
+                print(f"⏯️  Resuming upload of {rel_path} at {offset * 100 // st.st_size}%")
+                request.resumable_uri = session['uri']
+                request.resumable_progress = offset
+        
+        expires = session['expires'] if session is not None else time.time() + UPLOAD_SESSION_TTL
+        
+        def save_progress():
+            self._save_upload_session(rel_path, {
+                'uri': request.resumable_uri,
+                'offset': request.resumable_progress,
+                'file_id': file_id,
+                'inode': st.st_ino,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+                'expires': expires,
+            })
+        
+        response = None
+        try:
+            while response is None:
+                _, response = self._limiter.call(request.next_chunk)
+                if response is None:
+                    save_progress()
+        except Exception:
+            if request.resumable_uri:
+                save_progress()
+            raise
+        self._drop_upload_session(rel_path)
+        return response
+    
+    def _update_drive_file(self, local_path: str, rel_path: str, file_id: str) -> Optional[Dict]:
+        """Upload new content for a known Drive file ID. Returns None if the ID is gone.
+        
+        Drive accepts updates to trashed files, so a file trashed on Drive
+        counts as gone too: the caller creates a visible one instead.
+        """
+        service = self._get_thread_service()
+        try:
+            file = self._execute_upload(service.files().update(
+                fileId=file_id,
+                media_body=self._media_upload(local_path),
+                fields='id, modifiedTime, md5Checksum, trashed'
+            ), local_path, rel_path, file_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            return None
+        if file.get('trashed'):
+            return None
+        print(f"📤 Updated: {rel_path}")
+        return file
+    
+    def _upload_file(self, local_path: str, md5: Optional[str] = None, in_new_folder: bool = False) -> bool:
+        """Upload a file to Google Drive. Returns True on success.
+        
+        in_new_folder means the parent folder was created this cycle, so the
+        file cannot exist on Drive yet and no lookup is needed.
+        """
+        rel_path = self._get_relative_path(local_path)
+        
+        try:
+            # Get modification time
+            st = os.stat(local_path)
             
-            file_metadata = {'name': file_name, 'parents': [parent_id]}
-            media = MediaFileUpload(local_path, resumable=True)
+            # Files synced before already have a Drive ID: update it without any lookup
+            with self._metadata_lock:
+                file_id = self.metadata['files'].get(rel_path, {}).get('drive_id')
+            file = self._update_drive_file(local_path, rel_path, file_id) if file_id else None
             
-            if files:
-                # Update existing file
-                file_id = files[0]['id']
-                file = service.files().update(
-                    fileId=file_id,
-                    media_body=media,
-                    fields='id, modifiedTime'
-                ).execute()
-                print(f"📤 Updated: {rel_path}")
+            if file is None:
+                # Get or create parent folder in Drive
+                folder_path = self._get_drive_path(rel_path)
+                parent_id = self._get_or_create_drive_folder_path(folder_path)
+                
+                try:
+                    file, copied = self._upload_to_folder(local_path, rel_path, parent_id,
+                                                          known_new=in_new_folder, md5=md5)
+                except HttpError as e:
+                    if e.resp.status != 404 or not folder_path:
+                        raise
+                    # A cached folder ID no longer exists on Drive; resolve the path again
+                    self._forget_drive_folder_path(folder_path)
+                    parent_id = self._get_or_create_drive_folder_path(folder_path)
+                    file, copied = self._upload_to_folder(local_path, rel_path, parent_id, md5=md5)
             else:
-                # Create new file
-                file = service.files().create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields='id, modifiedTime'
-                ).execute()
-                print(f"📤 Uploaded: {rel_path}")
+                copied = False
             
-            # Update metadata (thread-safe)
             with self._metadata_lock:
-                self.metadata['files'][rel_path] = {
-                    'mtime': mtime,
-                    'drive_id': file['id'],
-                    'drive_mtime': file.get('modifiedTime')
-                }
+                if copied:
+                    self._upload_modes['copy'] += 1
+                    self._bytes_saved += st.st_size
+                else:
+                    self._upload_modes[self._upload_mode(st.st_size)] += 1
+            
+            # Drive's checksum describes what was actually uploaded
+            self._record_file(rel_path, self._file_entry(
+                st, file['id'], file.get('modifiedTime'), file.get('md5Checksum') or md5
+            ))
+            self._remember_local_stat(rel_path, st)
+            self._drive_tree.record_upload(rel_path, file)
+            return True
             
         except Exception as e:
             print(f"❌ Error uploading {rel_path}: {e}")
+            return False
+    
+    @staticmethod
+    def _partial_paths(local_path: str) -> Tuple[str, str]:
+        """(partial content, sidecar) paths of an in-progress download, hidden and skipped by scans."""
+        directory, name = os.path.split(local_path)
+        return (os.path.join(directory, f".{name}.part{TEMP_SUFFIX}"),
+                os.path.join(directory, f".{name}.part-info{TEMP_SUFFIX}"))
+    
+    def _fetch_range(self, request, start: int) -> Tuple[bytes, int, bool]:
+        """GET one DOWNLOAD_CHUNK_SIZE range of a media request.
+        
+        Returns (content, total_size, ranged); ranged is False if the server
+        ignored the Range header and sent the whole file.
+        """
+        headers = dict(request.headers)
+        headers['range'] = f'bytes={start}-{start + DOWNLOAD_CHUNK_SIZE - 1}'
+        resp, content = request.http.request(request.uri, 'GET', headers=headers)
+        if resp.status == 416:
+            # Nothing left past start: the partial file is already complete
+            return b'', int(resp['content-range'].rsplit('/', 1)[1]), True
+        if resp.status not in (200, 206):
+            raise HttpError(resp, content, uri=request.uri)
+        if resp.status == 200:
+            return content, len(content), False
+        return content, int(resp['content-range'].rsplit('/', 1)[1]), True
     
-    def _download_file(self, file_id: str, file_name: str, local_path: str, drive_mtime: str):
-        """Download a file from Google Drive."""
+    def _download_sequential(self, file_id: str, part_path: str, info_path: str,
+                             revision: Dict, saved: Optional[Dict], rel_path: str) -> str:
+        """Fetch ranges one after another, appending to the partial file. Returns its md5."""
+        request = self._get_thread_service().files().get_media(fileId=file_id)
+        offset = 0
+        if saved is not None and 'chunks' not in saved:
+            try:
+                offset = os.path.getsize(part_path)
+            except OSError:
+                pass
+        if offset == 0:
+            with open(info_path, 'w') as f:
+                json.dump({'revision': revision}, f)
+        else:
+            print(f"⏯️  Resuming download of {rel_path} at {offset} bytes")
+        
+        digest = hashlib.md5()
+        with open(part_path, 'r+b' if offset else 'wb') as fh:
+            if offset:
+                # Hash what an earlier attempt already stored, then continue after it
+                for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            while True:
+                content, total, ranged = self._limiter.call(self._fetch_range, request, offset)
+                if not ranged and offset:
+                    # Whole file came back: start the partial over
+                    fh.seek(0)
+                    fh.truncate()
+                    digest, offset = hashlib.md5(), 0
+                fh.write(content)
+                digest.update(content)
+                offset += len(content)
+                if offset >= total or not content:
+                    break
+        return digest.hexdigest()
+    
+    def _download_parallel(self, file_id: str, part_path: str, info_path: str,
+                           revision: Dict, saved: Optional[Dict], size: int, rel_path: str) -> str:
+        """Fetch DOWNLOAD_CHUNK_SIZE ranges concurrently into a preallocated partial file.
+        
+        The calling worker fetches ranges itself and up to
+        PARALLEL_DOWNLOAD_STREAMS - 1 helpers on the shared pool pull from the
+        same queue; helpers that have not started when the work runs out are
+        cancelled, so a busy pool never blocks the download. Every range goes
+        through the rate limiter, which caps API concurrency globally.
+        Completed ranges are listed in the sidecar so a later attempt only
+        fetches the rest. Returns the md5 of the stitched file.
+        """
+        chunks = -(-size // DOWNLOAD_CHUNK_SIZE)
+        done = set(saved['chunks']) if saved is not None and 'chunks' in saved else set()
+        if done:
+            print(f"⏯️  Resuming download of {rel_path} ({len(done)}/{chunks} ranges already stored)")
+        pending = deque(index for index in range(chunks) if index not in done)
+        lock = threading.Lock()
+        errors = []
+        
+        def record_progress():
+            with open(info_path, 'w') as f:
+                json.dump({'revision': revision, 'chunks': sorted(done)}, f)
+        
+        fd = os.open(part_path, os.O_RDWR | os.O_CREAT | (0 if done else os.O_TRUNC), 0o644)
         try:
-            service = self._get_thread_service()
-            request = service.files().get_media(fileId=file_id)
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except (AttributeError, OSError):
+                os.ftruncate(fd, size)  # No preallocation support here; a sparse file works too
+            if not done:
+                record_progress()
+            
+            def fetch_ranges():
+                request = self._get_thread_service().files().get_media(fileId=file_id)
+                while True:
+                    with lock:
+                        if errors or not pending:
+                            return
+                        index = pending.popleft()
+                    try:
+                        content, total, ranged = self._limiter.call(
+                            self._fetch_range, request, index * DOWNLOAD_CHUNK_SIZE)
+                        if not ranged or total != size:
+                            raise ValueError("Drive did not serve the expected byte range")
+                        os.pwrite(fd, content, index * DOWNLOAD_CHUNK_SIZE)
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        return
+                    with lock:
+                        done.add(index)
+                        record_progress()
             
+            helpers = [self._executor.submit(fetch_ranges)
+                       for _ in range(min(PARALLEL_DOWNLOAD_STREAMS, len(pending)) - 1)]
+            fetch_ranges()
+            for helper in helpers:
+                if not helper.cancel():
+                    helper.result()
+            if errors:
+                raise errors[0]
+        finally:
+            os.close(fd)
+        
+        digest = hashlib.md5()
+        with open(part_path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _download_file(self, file_id: str, file_name: str, local_path: str, drive_mtime: str,
+                       md5: Optional[str] = None, size: Optional[int] = None) -> bool:
+        """Download a file from Google Drive. Returns True on success.
+        
+        Content is fetched in DOWNLOAD_CHUNK_SIZE Range requests into a hidden
+        partial file next to the target, concurrently for files of at least
+        PARALLEL_DOWNLOAD_THRESHOLD bytes. A sidecar records which remote
+        revision (file ID and md5Checksum, or modifiedTime) the partial holds,
+        so a later attempt for the same revision continues where this one
+        stopped. The result is checked against md5Checksum and then swapped in
+        atomically, so readers never see a half-written file.
+        """
+        try:
             # Ensure parent directory exists
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            rel_path = self._get_relative_path(local_path)
             
-            # Download file
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
+            part_path, info_path = self._partial_paths(local_path)
+            revision = {'file_id': file_id, 'md5': md5, 'drive_mtime': None if md5 else drive_mtime}
+            saved = None
+            try:
+                with open(info_path) as f:
+                    saved = json.load(f)
+                if saved.get('revision') != revision:
+                    saved = None
+            except (OSError, ValueError, AttributeError):
+                saved = None
             
-            # Write to file and close immediately
-            with open(local_path, 'wb') as f:
-                f.write(fh.getvalue())
+            if size is not None and size >= PARALLEL_DOWNLOAD_THRESHOLD:
+                checksum = self._download_parallel(file_id, part_path, info_path, revision, saved, size, rel_path)
+            else:
+                checksum = self._download_sequential(file_id, part_path, info_path, revision, saved, rel_path)
+            
+            if md5 and checksum != md5:
+                os.unlink(part_path)
+                os.unlink(info_path)
+                raise ValueError(f"checksum mismatch (expected {md5}, got {checksum})")
+            os.replace(part_path, local_path)
+            os.unlink(info_path)
             
-            rel_path = self._get_relative_path(local_path)
             print(f"📥 Downloaded: {rel_path}")
             
-            # Update metadata (thread-safe)
-            mtime = os.path.getmtime(local_path)
-            with self._metadata_lock:
-                self.metadata['files'][rel_path] = {
-                    'mtime': mtime,
-                    'drive_id': file_id,
-                    'drive_mtime': drive_mtime
-                }
+            st = os.stat(local_path)
+            self._record_file(rel_path, self._file_entry(st, file_id, drive_mtime, md5))
+            self._remember_local_stat(rel_path, st)
+            self._drive_tree.record_download(rel_path, file_id, drive_mtime)
+            return True
             
         except Exception as e:
             print(f"❌ Error downloading {file_name}: {e}")
+            return False
     
-    def _scan_local_files(self) -> Set[str]:
-        """Scan local folder and return set of relative paths."""
-        local_files = set()
-        for root, dirs, files in os.walk(LOCAL_FOLDER):
-            for file in files:
-                full_path = os.path.join(root, file)
-                rel_path = self._get_relative_path(full_path)
-                local_files.add(rel_path)
-        return local_files
+    def _walk_local_folder(self) -> Dict[str, LocalStat]:
+        """Stat every local file once with os.scandir."""
+        snapshot = {}
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            try:
+                with os.scandir(os.path.join(self.local_folder, rel_dir)) as entries:
+                    for entry in entries:
+                        rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(rel_path)
+                            elif entry.is_file() and not entry.name.endswith(TEMP_SUFFIX):
+                                snapshot[rel_path] = LocalStat.from_stat(entry.stat())
+                        except OSError:
+                            continue  # Vanished while walking
+            except OSError:
+                continue
+        return snapshot
     
-    def _scan_drive_files(self, folder_id: str = None, prefix: str = '') -> Dict[str, Dict]:
-        """Recursively scan Drive folder and return dict of files with metadata.
+    def _refresh_local_snapshot(self) -> Set[str]:
+        """Bring the local snapshot up to date and return the paths that may have changed.
         
-        Subfolders are scanned in parallel using a thread pool for speed.
+        When the inotify watcher is running, only paths changed since the last
+        cycle are stat'ed again; the whole folder is walked on the first cycle
+        and whenever the watcher lost events.
         """
-        if folder_id is None:
-            folder_id = self.drive_root_id
+        dirty = self._watcher.drain() if self._watcher is not None else None
+        if dirty is None or self._local_snapshot is None:
+            self._local_snapshot = self._walk_local_folder()
+            return set(self._local_snapshot)
         
-        drive_files = {}
-        subfolders = []  # Collect (folder_id, folder_path) for parallel scan
-        page_token = None
+        changed = set()
+        for rel_path in dirty:
+            if rel_path.endswith(TEMP_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.local_folder, rel_path))
+            except OSError:
+                st = None
+            if st is None or not stat.S_ISREG(st.st_mode):
+                self._local_snapshot.pop(rel_path, None)
+                continue
+            self._local_snapshot[rel_path] = LocalStat.from_stat(st)
+            changed.add(rel_path)
+        return changed
+    
+    def _remember_local_stat(self, rel_path: str, st: os.stat_result):
+        """Patch the local snapshot after we changed or re-stat'ed a file."""
+        if self._local_snapshot is not None:
+            self._local_snapshot[rel_path] = LocalStat.from_stat(st)
+    
+    @staticmethod
+    def _drive_file_info(item: Dict) -> Dict:
+        """The file info scans report for a Drive item listed with DRIVE_ITEM_FIELDS."""
+        return {
+            'id': item['id'],
+            'mtime': item.get('modifiedTime'),
+            'name': item['name'],
+            'md5': item.get('md5Checksum'),
+            'size': int(item['size']) if 'size' in item else None
+        }
+    
+    @staticmethod
+    def _parents_query(folder_ids: List[str]) -> str:
+        """Query for the non-trashed children of any of folder_ids."""
+        parents = ' or '.join(f"'{folder_id}' in parents" for folder_id in folder_ids)
+        return f"({parents}) and trashed=false"
+    
+    def _take_query_group(self, frontier: deque, size: int) -> List[Tuple[str, str]]:
+        """Pop up to size folders off the frontier, keeping their OR'd query under MAX_QUERY_LENGTH."""
+        group = [frontier.popleft()]
+        while frontier and len(group) < size:
+            if len(self._parents_query([fid for fid, _ in group] + [frontier[0][0]])) > MAX_QUERY_LENGTH:
+                break
+            group.append(frontier.popleft())
+        return group
+    
+    def _list_drive_folders(self, group: List[Tuple[str, str]]) -> Dict[str, Tuple[Dict[str, Dict], List[Tuple[str, str]]]]:
+        """List several Drive folders (all pages) with one OR'd parents query.
         
+        group is a list of (folder_id, folder_path). Results are split back per
+        folder using each item's parents. Returns folder_id -> (files,
+        subfolders) where files maps relative path -> metadata and subfolders
+        is a list of (folder_id, folder_path).
+        """
         service = self._get_thread_service()
+        prefixes = dict(group)
+        listings = {folder_id: ({}, []) for folder_id in prefixes}
+        page_token = None
         
         while True:
-            query = f"'{folder_id}' in parents and trashed=false"
-            results = service.files().list(
-                q=query,
+            results = self._execute(service.files().list(
+                q=self._parents_query(list(prefixes)),
                 spaces='drive',
-                fields='nextPageToken, files(id, name, mimeType, modifiedTime)',
+                pageSize=1000,
+                fields=f'nextPageToken, files({DRIVE_ITEM_FIELDS})',
                 pageToken=page_token
-            ).execute()
+            ))
             
             for file in results.get('files', []):
                 file_name = file['name']
-                file_path = os.path.join(prefix, file_name) if prefix else file_name
-                
-                if file['mimeType'] == 'application/vnd.google-apps.folder':
-                    subfolders.append((file['id'], file_path))
-                else:
-                    drive_files[file_path] = {
-                        'id': file['id'],
-                        'mtime': file.get('modifiedTime'),
-                        'name': file_name
-                    }
+                for parent_id in file.get('parents', []):
+                    if parent_id not in prefixes:
+                        continue
+                    prefix = prefixes[parent_id]
+                    drive_files, subfolders = listings[parent_id]
+                    file_path = os.path.join(prefix, file_name) if prefix else file_name
+                    
+                    if file['mimeType'] == 'application/vnd.google-apps.folder':
+                        subfolders.append((file['id'], file_path))
+                    else:
+                        drive_files[file_path] = self._drive_file_info(file)
             
             page_token = results.get('nextPageToken')
             if not page_token:
                 break
         
-        # Scan subfolders in parallel
-        if subfolders:
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                futures = {
-                    executor.submit(self._scan_drive_files, fid, fpath): fpath
-                    for fid, fpath in subfolders
-                }
-                for future in as_completed(futures):
-                    try:
-                        subfolder_files = future.result()
-                        drive_files.update(subfolder_files)
-                    except Exception as e:
-                        print(f"❌ Error scanning subfolder {futures[future]}: {e}")
-        
-        return drive_files
+        return listings
     
-    def sync_up(self):
-        """Upload local changes to Google Drive (parallel uploads)."""
-        print("\n🔼 Checking for local changes to upload...")
-        local_files = self._scan_local_files()
+    def _crawl_drive(self, folder_id: str, prefix: str = '') -> Iterator[Tuple[str, Optional[Dict[str, Dict]], List[Tuple[str, str]]]]:
+        """Breadth-first crawl of a Drive folder tree.
+        
+        Folders wait in a FIFO frontier and are listed by the shared pool with at
+        most MAX_WORKERS listings in flight. Each listing covers a group of
+        folders with one OR'd parents query: a small frontier is spread over
+        idle workers, a large one is packed into groups of up to
+        MAX_FOLDERS_PER_QUERY (fewer if the query would get too long, or after
+        Drive rejects a query). Yields (folder_path, files, subfolders) as each
+        folder finishes; files is None if listing failed.
+        """
+        frontier = deque([(folder_id, prefix)])
+        in_flight = {}
+        group_limit = MAX_FOLDERS_PER_QUERY
         
-        # Determine which files need uploading
-        files_to_upload = []
-        for rel_path in local_files:
-            full_path = os.path.join(LOCAL_FOLDER, rel_path)
-            mtime = os.path.getmtime(full_path)
+        while frontier or in_flight:
+            while frontier and len(in_flight) < MAX_WORKERS:
+                idle_workers = MAX_WORKERS - len(in_flight)
+                size = min(group_limit, -(-len(frontier) // idle_workers))
+                group = self._take_query_group(frontier, size)
+                in_flight[self._executor.submit(self._list_drive_folders, group)] = group
             
-            if rel_path not in self.metadata['files']:
-                files_to_upload.append(full_path)
-            else:
-                stored_mtime = self.metadata['files'][rel_path].get('mtime', 0)
-                if mtime > stored_mtime:
-                    files_to_upload.append(full_path)
-        
-        if not files_to_upload:
-            print("✅ No local changes to upload")
-            return
-        
-        # Upload files in parallel
-        uploaded = 0
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(self._upload_file, fp): fp for fp in files_to_upload}
-            for future in as_completed(futures):
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                group = in_flight.pop(future)
                 try:
-                    future.result()
-                    uploaded += 1
+                    listings = future.result()
                 except Exception as e:
-                    print(f"❌ Error uploading {futures[future]}: {e}")
+                    if isinstance(e, HttpError) and e.resp.status == 400 and len(group) > 1:
+                        # Query too long or complex for Drive: use smaller groups
+                        group_limit = max(1, len(group) // 2)
+                        frontier.extendleft(reversed(group))
+                        continue
+                    print(f"❌ Error scanning subfolder(s) {', '.join(fpath or '.' for _, fpath in group)}: {e}")
+                    for _, fpath in group:
+                        yield fpath, None, []
+                    continue
+                for fid, fpath in group:
+                    files, subfolders = listings[fid]
+                    frontier.extend(subfolders)
+                    yield fpath, files, subfolders
+    
+    def _list_all_drive_items(self, first_page: Optional[Dict] = None) -> Iterator[Dict]:
+        """Page through every non-trashed item the account can see.
         
-        print(f"✅ Uploaded {uploaded} file(s)")
+        first_page, if given, is an already fetched first page of this listing.
+        """
+        service = self._get_thread_service()
+        results = first_page
+        while True:
+            if results is None:
+                results = self._flat_list_page(service, None)
+            yield from results.get('files', [])
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return
+            results = self._flat_list_page(service, page_token)
     
-    def sync_down(self):
-        """Download changes from Google Drive (parallel downloads)."""
-        print("\n🔽 Checking for Drive changes to download...")
-        drive_files = self._scan_drive_files()
+    def _flat_list_page(self, service, page_token: Optional[str]) -> Dict:
+        return self._execute(service.files().list(
+            q='trashed=false',
+            spaces='drive',
+            pageSize=FLAT_SCAN_PAGE_SIZE,
+            fields=f'nextPageToken, files({DRIVE_ITEM_FIELDS})',
+            pageToken=page_token
+        ))
+    
+    def _choose_flat_scan(self) -> Optional[Dict]:
+        """Decide whether listing the whole account beats crawling our folder tree.
         
-        # Determine which files need downloading
-        files_to_download = []  # List of (file_id, file_name, local_path, drive_mtime)
-        for rel_path, file_info in drive_files.items():
-            local_path = os.path.join(LOCAL_FOLDER, rel_path)
-            
-            if not os.path.exists(local_path):
-                files_to_download.append((
-                    file_info['id'], file_info['name'], local_path, file_info['mtime']
+        Fetches the first page of the account-wide listing as a sample. If it
+        is the only page, or the share of sampled items that sit in folders we
+        already know suggests fewer flat pages than crawl requests, returns the
+        page so the flat scan can continue from it; otherwise returns None.
+        """
+        if DRIVE_SCAN_MODE == 'crawl':
+            return None
+        results = self._flat_list_page(self._get_thread_service(), None)
+        if DRIVE_SCAN_MODE == 'flat' or not results.get('nextPageToken'):
+            return results
+        
+        known_folders = set(self.metadata.get('drive_folders', {}).values())
+        known_folders.add(self.drive_root_id)
+        sample = results.get('files', [])
+        in_tree = sum(1 for item in sample if known_folders.intersection(item.get('parents', [])))
+        if not in_tree:
+            return None
+        
+        tree_items = len(self.metadata.get('files', {})) + len(known_folders)
+        flat_requests = tree_items * len(sample) / in_tree / FLAT_SCAN_PAGE_SIZE
+        crawl_requests = len(known_folders) / MAX_FOLDERS_PER_QUERY + tree_items / FLAT_SCAN_PAGE_SIZE
+        return results if flat_requests <= crawl_requests else None
+    
+    def _flat_scan_drive(self, first_page: Optional[Dict], folder_id: str, prefix: str,
+                         folders: Optional[Dict[str, str]]) -> Dict[str, Dict]:
+        """Rebuild the tree under folder_id from an account-wide listing."""
+        children = {}
+        for item in self._list_all_drive_items(first_page):
+            for parent_id in item.get('parents', []):
+                children.setdefault(parent_id, []).append(item)
+        
+        drive_files = {}
+        frontier = deque([(folder_id, prefix)])
+        seen = {folder_id}
+        while frontier:
+            parent_id, parent_path = frontier.popleft()
+            for item in children.get(parent_id, []):
+                file_path = os.path.join(parent_path, item['name']) if parent_path else item['name']
+                if item['mimeType'] == 'application/vnd.google-apps.folder':
+                    if item['id'] in seen:
+                        continue
+                    seen.add(item['id'])
+                    frontier.append((item['id'], file_path))
+                    if folders is not None:
+                        folders[file_path] = item['id']
+                else:
+                    drive_files[file_path] = self._drive_file_info(item)
+        
+        print(f"🗂️  Listed the whole Drive account to rebuild {len(seen)} folder(s)")
+        return drive_files
+    
+    def _scan_drive_files(self, folder_id: str = None, prefix: str = '',
+                          folders: Optional[Dict[str, str]] = None,
+                          failed: Optional[List[str]] = None,
+                          on_files: Optional[Callable[[Dict[str, Dict]], None]] = None) -> Dict[str, Dict]:
+        """Scan Drive folder tree and return dict of files with metadata.
+        
+        Depending on DRIVE_SCAN_MODE and a sampled estimate of how much of the
+        account our tree makes up, the tree is either rebuilt from one flat
+        listing of the whole account or crawled breadth-first by _crawl_drive.
+        If ``folders`` is given, every folder found is recorded in it as
+        relative path -> folder ID; if ``failed`` is given, paths of folders
+        that could not be listed are appended to it. ``on_files`` is called
+        with each folder's files as soon as the crawl has listed them (once
+        with everything for a flat scan, which needs the whole listing to
+        resolve paths).
+        """
+        if folder_id is None:
+            folder_id = self.drive_root_id
+        
+        try:
+            first_page = self._choose_flat_scan()
+            if first_page is not None:
+                flat_folders = {}
+                drive_files = self._flat_scan_drive(first_page, folder_id, prefix, flat_folders)
+                if folders is not None:
+                    folders.update(flat_folders)
+                if on_files is not None:
+                    on_files(drive_files)
+                return drive_files
+        except Exception as e:
+            print(f"⚠️  Flat Drive listing failed ({e}), crawling folders instead")
+        
+        drive_files = {}
+        for folder_path, files, subfolders in self._crawl_drive(folder_id, prefix):
+            if files is None:
+                if failed is not None:
+                    failed.append(folder_path)
+                continue
+            drive_files.update(files)
+            if folders is not None:
+                folders.update({fpath: fid for fid, fpath in subfolders})
+            if on_files is not None and files:
+                on_files(files)
+        
+        return drive_files
+    
+    def _get_start_page_token(self) -> str:
+        """Get the current position of the Drive changes feed."""
+        service = self._get_thread_service()
+        response = self._execute(service.changes().getStartPageToken())
+        return response['startPageToken']
+    
+    def _full_scan_drive(self, on_files: Optional[Callable[[Dict[str, Dict]], None]] = None
+                         ) -> Tuple[Dict[str, Dict], Optional[str]]:
+        """Scan the whole Drive tree and return the changes feed position to resume from.
+        
+        on_files receives the files as they are listed (see _scan_drive_files).
+        The page token is taken *before* scanning so that nothing modified
+        during the scan is missed by the next incremental cycle. It is None
+        if some folders could not be listed.
+        """
+        page_token = self._get_start_page_token()
+        with self._metadata_lock:
+            known_folders = dict(self.metadata.get('drive_folders', {}))
+        folders = {}
+        failed = []
+        drive_files = self._scan_drive_files(folders=folders, failed=failed, on_files=on_files)
+        self._merge_drive_folders(known_folders, folders)
+        self.metadata['drive_root_id'] = self.drive_root_id
+        if failed:
+            # Files under folders we could not list would never show up in the
+            # changes feed, so stay in full-scan mode until a scan is complete
+            return drive_files, None
+        return drive_files, page_token
+    
+    def _list_drive_changes(self, page_token: str) -> Optional[Tuple[List[Dict], str]]:
+        """Fetch all changes since page_token.
+        
+        Returns (changes, new_start_page_token), or None if the token is no
+        longer valid and a full scan is required.
+        """
+        service = self._get_thread_service()
+        changes = []
+        try:
+            while True:
+                results = self._execute(service.changes().list(
+                    pageToken=page_token,
+                    spaces='drive',
+                    includeRemoved=True,
+                    pageSize=1000,
+                    fields='nextPageToken, newStartPageToken, '
+                           f'changes(fileId, removed, file({DRIVE_ITEM_FIELDS}, trashed))'
                 ))
+                changes.extend(results.get('changes', []))
+                if 'newStartPageToken' in results:
+                    return changes, results['newStartPageToken']
+                page_token = results['nextPageToken']
+        except HttpError as e:
+            if e.resp.status in (400, 404, 410):
+                print(f"⚠️  Drive changes token is no longer valid, running full scan")
+                return None
+            raise
+    
+    def _scan_drive_changes(self) -> Optional[Tuple[Dict[str, Dict], str]]:
+        """Return files under the sync root that changed since the last cycle.
+        
+        Uses the Drive changes feed and the stored folder map to resolve paths;
+        folders new to the map are listed, since a folder moved in from outside
+        the root brings files the feed does not report.
+        Returns (drive_files, new_page_token), or None when a full scan is
+        required (first run, invalid token, or a known folder was moved/renamed).
+        """
+        page_token = self.metadata.get('start_page_token')
+        if not page_token or self.metadata.get('drive_root_id') != self.drive_root_id:
+            return None
+        
+        listed = self._list_drive_changes(page_token)
+        if listed is None:
+            return None
+        changes, new_page_token = listed
+        
+        with self._metadata_lock:
+            known_folders = dict(self.metadata.get('drive_folders', {}))
+        folders = dict(known_folders)
+        id_to_path = {fid: path for path, fid in folders.items()}
+        id_to_path[self.drive_root_id] = ''
+        
+        def child_path(parent_id: str, name: str) -> str:
+            parent_path = id_to_path[parent_id]
+            return os.path.join(parent_path, name) if parent_path else name
+        
+        # Resolve folder changes first; a new folder may be listed after its children
+        pending_folders = []
+        file_changes = []
+        gone_ids = set()
+        for change in changes:
+            file = change.get('file')
+            file_id = change['fileId']
+            gone = change.get('removed') or not file or file.get('trashed')
+            if gone:
+                if file_id in id_to_path and file_id != self.drive_root_id:
+                    removed_path = id_to_path[file_id]
+                    for path in [p for p in folders if p == removed_path or p.startswith(removed_path + os.sep)]:
+                        id_to_path.pop(folders.pop(path), None)
+                else:
+                    gone_ids.add(file_id)
+                continue
+            if file['mimeType'] == 'application/vnd.google-apps.folder':
+                pending_folders.append(file)
             else:
-                if rel_path in self.metadata['files']:
-                    stored_drive_mtime = self.metadata['files'][rel_path].get('drive_mtime')
-                    if file_info['mtime'] != stored_drive_mtime:
-                        local_mtime = os.path.getmtime(local_path)
-                        stored_local_mtime = self.metadata['files'][rel_path].get('mtime', 0)
-                        
-                        if local_mtime == stored_local_mtime:
-                            files_to_download.append((
-                                file_info['id'], file_info['name'], local_path, file_info['mtime']
-                            ))
-                        else:
-                            print(f"⚠️  Conflict detected: {rel_path} (keeping local version)")
-        
-        if not files_to_download:
-            print("✅ No Drive changes to download")
-            return
-        
-        # Download files in parallel
-        downloaded = 0
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {
-                executor.submit(self._download_file, fid, fname, lpath, dmtime): fname
-                for fid, fname, lpath, dmtime in files_to_download
-            }
-            for future in as_completed(futures):
+                file_changes.append(file)
+        
+        new_folders = {}  # folder ID -> parent ID of folders the map did not know
+        progress = True
+        while pending_folders and progress:
+            progress = False
+            for file in list(pending_folders):
+                parent_id = next((p for p in file.get('parents', []) if p in id_to_path), None)
+                if parent_id is None:
+                    continue
+                pending_folders.remove(file)
+                progress = True
+                path = child_path(parent_id, file['name'])
+                if file['id'] in id_to_path:
+                    if id_to_path[file['id']] != path:
+                        # Moved or renamed: every path below it changed, rescan
+                        return None
+                    continue
+                folders[path] = file['id']
+                id_to_path[file['id']] = path
+                new_folders[file['id']] = parent_id
+        
+        # Folders left pending are outside the sync root; a known one moving out needs a rescan
+        if any(file['id'] in id_to_path for file in pending_folders):
+            return None
+        
+        # A folder moved in from outside the root brings children the feed never
+        # reports, so list every new subtree (its own changes are merged below)
+        drive_files = {}
+        for folder_id, parent_id in new_folders.items():
+            if parent_id in new_folders:
+                continue
+            for folder_path, files, subfolders in self._crawl_drive(folder_id, id_to_path[folder_id]):
+                if files is None:
+                    return None
+                drive_files.update(files)
+                for subfolder_id, subfolder_path in subfolders:
+                    folders[subfolder_path] = subfolder_id
+                    id_to_path[subfolder_id] = subfolder_path
+        
+        for file in file_changes:
+            parent_id = next((p for p in file.get('parents', []) if p in id_to_path), None)
+            if parent_id is None:
+                continue
+            drive_files[child_path(parent_id, file['name'])] = self._drive_file_info(file)
+        
+        self._merge_drive_folders(known_folders, folders)
+        if gone_ids:
+            self._forget_drive_files(gone_ids)
+        return drive_files, new_page_token
+    
+    def _forget_drive_files(self, file_ids: Set[str]):
+        """Drop the Drive IDs of tracked files that were removed or trashed on Drive.
+        
+        The local copies stay; their next upload creates a new visible file
+        instead of writing into the trashed one.
+        """
+        forgotten = []
+        with self._metadata_lock:
+            # Checked and replaced under one lock, so an upload recording a new ID is not undone
+            for rel_path, entry in self.metadata['files'].items():
+                if entry.get('drive_id') in file_ids:
+                    entry = {key: value for key, value in entry.items() if key != 'drive_id'}
+                    self.metadata['files'][rel_path] = entry
+                    forgotten.append((rel_path, entry))
+        for rel_path, entry in forgotten:
+            self._store.put_file(rel_path, entry)
+    
+    def _download_plan(self, rel_path: str, file_info: Dict) -> Optional[Tuple]:
+        """Decide what to do with a changed Drive file.
+        
+        Returns the (file_id, file_name, local_path, drive_mtime, md5, size) to
+        download, or None if the local copy is already current or was edited
+        locally (conflict: the local version is kept).
+        """
+        local_path = os.path.join(self.local_folder, rel_path)
+        download = (file_info['id'], file_info['name'], local_path, file_info['mtime'],
+                    file_info.get('md5'), file_info.get('size'))
+        local_stat = self._local_snapshot.get(rel_path)
+        if local_stat is None:
+            return download
+        
+        entry = self.metadata['files'].get(rel_path)
+        if entry is None:
+            return None
+        if file_info['mtime'] == entry.get('drive_mtime'):
+            self._drive_tree.record_download(rel_path, file_info['id'], file_info['mtime'])
+            return None
+        if file_info.get('md5') and file_info['md5'] == entry.get('md5'):
+            # Metadata-only change on Drive (or our own upload): same bytes
+            self._record_file(rel_path, {**entry, 'drive_id': file_info['id'],
+                                         'drive_mtime': file_info['mtime']})
+            self._drive_tree.record_download(rel_path, file_info['id'], file_info['mtime'])
+            return None
+        if local_stat.mtime == entry.get('mtime', 0):
+            return download
+        print(f"⚠️  Conflict detected: {rel_path} (keeping local version)")
+        return None
+    
+    def _remote_scan_stage(self, events: queue.Queue, slots: threading.Semaphore):
+        """Pipeline stage: scan Drive and stream the files that changed remotely.
+        
+        A full scan hands over each folder's files as soon as it is listed, so
+        downloads start while the rest of the tree is still being crawled.
+        After an incremental scan, downloads that failed in earlier cycles are
+        queued again (the changes feed has moved past them). Each file takes a
+        slot before it is queued, so the stage runs at most
+        PIPELINE_QUEUE_SIZE files ahead of the planner.
+        """
+        echoes = 0
+        
+        def stream(drive_files: Dict[str, Dict]):
+            nonlocal echoes
+            # Drop the versions the local side already has before looking at local state
+            remote, dropped = self._drive_tree.reconcile(drive_files)
+            echoes += dropped
+            for rel_path, file_info in remote.items():
+                slots.acquire()
+                events.put(('remote', rel_path, file_info))
+        
+        try:
+            scanned = self._scan_drive_changes()
+            if scanned is None:
+                drive_files, new_page_token = self._full_scan_drive(on_files=stream)
+                self._drive_tree.retain({file_info['id'] for file_info in drive_files.values()})
+            else:
+                drive_files, new_page_token = scanned
+                stream(drive_files)
+                # A complete scan reports failed files again by itself
+                with self._metadata_lock:
+                    failed = dict(self.metadata.get('failed_downloads', {}))
+                stream({rel_path: retry['info'] for rel_path, retry in failed.items()
+                        if rel_path not in drive_files})
+            if echoes:
+                print(f"🔁 Ignored {echoes} Drive change(s) made by our own uploads")
+            events.put(('remote_done', new_page_token, None))
+        except Exception as e:
+            events.put(('remote_done', None, e))
+    
+    def _run_pipeline(self, local_files: Set[str], upload: bool = True, download: bool = True):
+        """Run one sync cycle as streaming stages.
+        
+        Hashing of locally changed files, the Drive scan and the transfers run
+        at the same time; a planner on the calling thread consumes their
+        results from one event queue. Uploads start as soon as a file's hash
+        shows new content, downloads as soon as the scan reports a remote
+        change. A remote change to a path that also changed locally waits
+        until the local side is decided: if the content really changed the
+        local version is uploaded and kept, otherwise the download goes ahead.
+        At most PIPELINE_DEPTH hashes and transfers are queued on the pool,
+        transfers first.
+        """
+        if upload:
+            print("\n🔼 Checking for local changes to upload...")
+        if download:
+            print("\n🔽 Checking for Drive changes to download...")
+        if self._local_snapshot is None:
+            self._local_snapshot = self._walk_local_folder()
+        
+        events = queue.Queue()
+        slots = threading.Semaphore(PIPELINE_QUEUE_SIZE)
+        transfers = deque()  # (kind, key, fn, args)
+        hashes = deque()
+        in_flight = 0
+        
+        def dispatch():
+            nonlocal in_flight
+            while in_flight < PIPELINE_DEPTH and (transfers or hashes):
+                kind, key, fn, args = (transfers or hashes).popleft()
+                future = self._executor.submit(fn, *args)
+                future.add_done_callback(lambda f, kind=kind, key=key: events.put((kind, key, f)))
+                in_flight += 1
+        
+        # Files whose mtime moved are only candidates; their content decides
+        local_state = {}  # rel_path -> 'hashing', 'upload', 'uploaded' or 'settled'
+        synced_drive_mtime = {}  # rel_path -> Drive version the local edit was based on
+        if upload:
+            self._prune_upload_sessions()
+            for rel_path in local_files:
+                entry = self.metadata['files'].get(rel_path)
+                if entry is None or self._local_snapshot[rel_path].mtime > entry.get('mtime', 0):
+                    local_state[rel_path] = 'hashing'
+                    synced_drive_mtime[rel_path] = entry.get('drive_mtime') if entry else None
+                    full_path = os.path.join(self.local_folder, rel_path)
+                    hashes.append(('hashed', rel_path, self._hash_local_file, (full_path,)))
+        hashing = len(hashes)
+        
+        remote_done = not download
+        remote_error = None
+        new_page_token = None
+        if download:
+            self._executor.submit(self._remote_scan_stage, events, slots)
+        
+        held = {}  # rel_path -> Drive file info waiting for the local side
+        downloading = {}  # rel_path -> Drive file info of downloads queued this cycle
+        failed_before = self.metadata.get('failed_downloads', {})
+        failed_downloads = {}  # rel_path -> {'info', 'attempts'} to retry next cycle
+        new_files = []  # (full_path, md5) of files without a Drive ID, uploaded once folders exist
+        duplicates = {}  # md5 -> uploads waiting to copy the first new file with that content
+        leaders = {}  # rel_path -> md5 of a new file whose duplicates wait for its upload
+        unchanged = 0
+        uploaded = upload_failed = 0
+        downloaded = download_failed = 0
+        self._upload_modes = Counter()
+        self._bytes_saved = 0
+        
+        def queue_download(rel_path: str, file_info: Dict):
+            plan = self._download_plan(rel_path, file_info)
+            if plan is not None:
+                downloading[rel_path] = file_info
+                transfers.append(('downloaded', rel_path, self._download_file, plan))
+        
+        def settle_uploaded(rel_path: str, file_info: Dict):
+            # Our upload replaced whatever Drive had; only a version other than the one
+            # the edit was based on (or the one the upload produced) is a conflict
+            entry = self.metadata['files'].get(rel_path, {})
+            if file_info['mtime'] not in (synced_drive_mtime.get(rel_path), entry.get('drive_mtime')):
+                print(f"⚠️  Conflict detected: {rel_path} (keeping local version)")
+        
+        dispatch()
+        while hashing or new_files or not remote_done or in_flight or transfers or hashes or duplicates:
+            if not hashing and new_files:
+                # Create folders for new files in bulk, so uploads neither look them
+                # up one segment at a time nor race each other to create them
+                new_folders = set()
                 try:
-                    future.result()
-                    downloaded += 1
+                    new_folders = self._prepare_drive_folders(
+                        {os.path.dirname(self._get_relative_path(fp)) for fp, _ in new_files} - {''})
                 except Exception as e:
-                    print(f"❌ Error downloading {futures[future]}: {e}")
+                    print(f"❌ Error preparing Drive folders: {e}")
+                try:
+                    # One reservation for the whole batch instead of a refill every ID_POOL_REFILL creates
+                    self._fill_id_pool(len(new_files))
+                except Exception as e:
+                    print(f"⚠️  Could not reserve Drive IDs in bulk: {e}")
+                for full_path, md5 in new_files:
+                    rel_path = self._get_relative_path(full_path)
+                    transfer = ('uploaded', rel_path, self._upload_file,
+                                (full_path, md5, os.path.dirname(rel_path) in new_folders))
+                    if md5 in duplicates:
+                        duplicates[md5].append(transfer)
+                    else:
+                        transfers.append(transfer)
+                        if self._duplicate_source(md5) is None:
+                            # First copy of this content: the others copy it once it is on Drive
+                            duplicates[md5] = []
+                            leaders[rel_path] = md5
+                new_files = []
+                dispatch()
+                continue
+            
+            kind, key, payload = events.get()
+            
+            if kind == 'remote':
+                slots.release()
+                state = local_state.get(key)
+                if state in ('hashing', 'upload'):
+                    held[key] = payload
+                elif state == 'uploaded':
+                    settle_uploaded(key, payload)
+                else:
+                    queue_download(key, payload)
+            elif kind == 'remote_done':
+                remote_done = True
+                new_page_token, remote_error = key, payload
+            else:
+                in_flight -= 1
+                if kind == 'hashed':
+                    hashing -= 1
+                    try:
+                        st, md5 = payload.result()
+                    except OSError as e:
+                        print(f"❌ Error reading {key}: {e}")
+                        st = md5 = None
+                    entry = self.metadata['files'].get(key)
+                    # Same bytes are only settled while Drive still has them (not trashed there)
+                    if md5 is not None and not (entry and entry.get('md5') == md5 and entry.get('drive_id')):
+                        local_state[key] = 'upload'
+                        full_path = os.path.join(self.local_folder, key)
+                        if entry and entry.get('drive_id'):
+                            # Known on Drive: update it right away
+                            transfers.append(('uploaded', key, self._upload_file, (full_path, md5)))
+                        else:
+                            new_files.append((full_path, md5))
+                    else:
+                        if md5 is not None:
+                            # Touched or rewritten with identical bytes: just remember the new stat
+                            self._record_file(key, self._file_entry(st, entry['drive_id'], entry.get('drive_mtime'), md5))
+                            self._remember_local_stat(key, st)
+                            unchanged += 1
+                        local_state[key] = 'settled'
+                        if key in held:
+                            queue_download(key, held.pop(key))
+                elif kind == 'uploaded':
+                    local_state[key] = 'uploaded'
+                    if key in leaders:
+                        transfers.extend(duplicates.pop(leaders.pop(key)))
+                    try:
+                        ok = payload.result()
+                    except Exception as e:
+                        print(f"❌ Error uploading {key}: {e}")
+                        ok = False
+                    if ok:
+                        uploaded += 1
+                    else:
+                        upload_failed += 1
+                        # Keep failed uploads dirty so the watcher retries them next cycle
+                        if self._watcher is not None:
+                            self._watcher.mark_dirty(key)
+                    if key in held:
+                        settle_uploaded(key, held.pop(key))
+                elif kind == 'downloaded':
+                    try:
+                        ok = payload.result()
+                    except Exception as e:
+                        print(f"❌ Error downloading {key}: {e}")
+                        ok = False
+                    if ok:
+                        downloaded += 1
+                    else:
+                        download_failed += 1
+                        previous = failed_before.get(key)
+                        same_version = previous and previous['info'] == downloading[key]
+                        attempts = previous['attempts'] + 1 if same_version else 1
+                        if attempts < DOWNLOAD_MAX_ATTEMPTS:
+                            failed_downloads[key] = {'info': downloading[key], 'attempts': attempts}
+                        else:
+                            print(f"⚠️  Giving up on {key} after {attempts} failed downloads")
+            dispatch()
         
-        print(f"✅ Downloaded {downloaded} file(s)")
+        if upload:
+            if unchanged:
+                print(f"⏭️  Skipped {unchanged} file(s) with unchanged content")
+            if uploaded or upload_failed:
+                print(f"✅ Uploaded {uploaded} file(s) "
+                      f"({self._upload_modes['multipart']} multipart, {self._upload_modes['resumable']} resumable, "
+                      f"{self._upload_modes['copy']} copied)")
+                if self._bytes_saved:
+                    print(f"♻️  Saved {self._bytes_saved} bytes by copying duplicates on Drive")
+            else:
+                print("✅ No local changes to upload")
+        if download:
+            if remote_error is not None:
+                raise remote_error
+            # The feed moves on every cycle; failed downloads are kept to retry instead
+            self.metadata['start_page_token'] = new_page_token
+            self.metadata['failed_downloads'] = failed_downloads
+            if downloaded or download_failed:
+                print(f"✅ Downloaded {downloaded} file(s)")
+            else:
+                print("✅ No Drive changes to download")
+    
+    def sync_up(self, local_files: Optional[Set[str]] = None):
+        """Upload local changes to Google Drive (parallel uploads).
+        
+        local_files are the paths to check, as returned by
+        _refresh_local_snapshot(); the snapshot is refreshed here if not given.
+        """
+        if local_files is None:
+            local_files = self._refresh_local_snapshot()
+        self._run_pipeline(local_files, download=False)
+    
+    def sync_down(self):
+        """Download changes from Google Drive (parallel downloads)."""
+        self._run_pipeline(set(), upload=False)
     
     def sync(self):
         """Perform a full bidirectional sync."""
@@ -418,17 +1784,21 @@ class GoogleDriveSync:
         print(f"{'='*60}")
         
         try:
-            self.sync_up()
-            self.sync_down()
+            # One local snapshot per cycle, read by every stage
+            self._run_pipeline(self._refresh_local_snapshot())
             self._save_metadata()
-            print(f"\n✅ Sync completed successfully!")
+            print(f"\n✅ Sync completed successfully! (Drive clients built so far: {self.clients_built})")
+            stats = self._limiter.stats()
+            print(f"📊 API: {stats['calls']} calls, {stats['qps']} qps, "
+                  f"concurrency {stats['concurrency_limit']}, "
+                  f"{stats['throttled']} throttled, {stats['retries']} retries")
         except Exception as e:
             print(f"\n❌ Sync failed: {e}")
     
     def run(self):
         """Run continuous sync loop."""
         print(f"🚀 Google Drive Sync started")
-        print(f"📂 Local folder: {LOCAL_FOLDER}")
+        print(f"📂 Local folder: {self.local_folder}")
         print(f"☁️  Drive folder: {DRIVE_FOLDER_NAME}")
         print(f"⏱️  Sync interval: {self.sync_interval} seconds")
         print(f"\nPress Ctrl+C to stop\n")
@@ -441,3 +1811,13 @@ class GoogleDriveSync:
         except KeyboardInterrupt:
             print("\n\n👋 Sync stopped by user")
             self._save_metadata()
+        finally:
+            self.close()
+    
+    def close(self):
+        """Stop the local watcher and the shared worker pool."""
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        self._executor.shutdown(wait=True)
+        self._store.close()
@@ -0,0 +1,190 @@
+import os
+import sys
+import struct
+import select
+import ctypes
+import ctypes.util
+import threading
+from typing import Dict, Optional, Set
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class LocalWatcher:
+    """Track local files changed between sync cycles using Linux inotify.
+
+    The watcher keeps a set of dirty relative paths. ``drain()`` hands that set
+    to the caller, or returns None when the caller must fall back to a full
+    walk (first cycle, kernel queue overflow, directory moves, and every
+    cycle while some directory could not be watched, e.g. at the inotify
+    watch limit; adding those watches is retried in the background).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._fd = None
+        self._watches: Dict[int, str] = {}  # wd -> directory path relative to root
+        self._dirty: Set[str] = set()
+        self._needs_full_scan = True
+        self._unwatched: Set[str] = set()  # Directories whose watch could not be added
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._libc = None
+
+    def start(self) -> bool:
+        """Start watching. Returns False if inotify is not available."""
+        if not sys.platform.startswith('linux'):
+            return False
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+            self._fd = fd
+            self._add_tree('.')
+        except (OSError, AttributeError) as e:
+            print(f"⚠️  inotify unavailable ({e}), falling back to full folder scans")
+            self.stop()
+            return False
+
+        self._thread = threading.Thread(target=self._run, name='local-watcher', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Stop watching and release the inotify descriptor."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def drain(self) -> Optional[Set[str]]:
+        """Return and clear the dirty paths, or None if a full walk is needed."""
+        with self._lock:
+            if self._needs_full_scan or self._unwatched:
+                self._needs_full_scan = False
+                self._dirty = set()
+                return None
+            dirty, self._dirty = self._dirty, set()
+            return dirty
+
+    def mark_dirty(self, rel_path: str):
+        """Re-queue a path, e.g. after a failed upload."""
+        with self._lock:
+            self._dirty.add(rel_path)
+
+    def _add_watch(self, rel_dir: str):
+        path = os.path.join(self.root, rel_dir)
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {path}: {os.strerror(errno)}")
+        self._watches[wd] = os.path.normpath(rel_dir)
+
+    def _add_tree(self, rel_dir: str, mark_files: bool = False):
+        """Watch a directory and everything below it."""
+        for root, dirs, files in os.walk(os.path.join(self.root, rel_dir)):
+            rel_root = os.path.relpath(root, self.root)
+            try:
+                self._add_watch(rel_root)
+            except OSError as e:
+                with self._lock:
+                    if not self._unwatched:
+                        print(f"⚠️  Local watcher error ({e}), syncs will do full scans until it is watched")
+                    self._unwatched.add(os.path.normpath(rel_root))
+            if mark_files:
+                # Files created before the watch was in place produced no events
+                with self._lock:
+                    for file in files:
+                        self._dirty.add(os.path.normpath(os.path.join(rel_root, file)))
+
+    def _retry_unwatched(self):
+        """Try again to watch directories that failed; walk everything once they are."""
+        with self._lock:
+            pending = list(self._unwatched)
+        for rel_dir in pending:
+            if os.path.isdir(os.path.join(self.root, rel_dir)):
+                try:
+                    self._add_watch(rel_dir)
+                except OSError:
+                    continue
+            with self._lock:
+                self._unwatched.discard(rel_dir)
+                # Changes made while it was unwatched produced no events
+                self._needs_full_scan = True
+
+    def _run(self):
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while not self._stop.is_set():
+            if self._unwatched:
+                self._retry_unwatched()
+            if not poller.poll(1000):
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            try:
+                self._handle_events(data)
+            except OSError as e:
+                # Unexpected; let the next cycle walk everything
+                print(f"⚠️  Local watcher error ({e}), next sync will do a full scan")
+                with self._lock:
+                    self._needs_full_scan = True
+
+    def _handle_events(self, data: bytes):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                with self._lock:
+                    self._needs_full_scan = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+
+            rel_dir = self._watches.get(wd)
+            if rel_dir is None or not name:
+                continue
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    # Watches below a moved directory now carry stale paths
+                    with self._lock:
+                        self._needs_full_scan = True
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(rel_path, mark_files=True)
+                continue
+
+            with self._lock:
+                self._dirty.add(rel_path)
@@ -29,6 +29,7 @@ def main():
         if args.sync_once:
             print("🔄 Running single sync...")
             sync.sync()
+            sync.close()
             print("\n✅ Single sync completed!")
         else:
             sync.run()
@@ -0,0 +1,258 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict
+
+JOURNAL_CHECKPOINT_ENTRIES = 10000  # Journal lines before the JSON checkpoint is rewritten
+
+class MetadataStore(ABC):
+    """Persistence backend for GoogleDriveSync metadata.
+
+    The metadata is a dict with a 'files' mapping (relative path -> entry)
+    plus small state keys (folder map, changes token, ...). Per-file entries
+    are written through put_file as transfers complete, state that must
+    survive a crash mid-cycle through put_state; save() persists everything
+    else at the end of a cycle.
+    """
+
+    @abstractmethod
+    def load(self) -> Dict:
+        ...
+
+    @abstractmethod
+    def put_file(self, rel_path: str, entry: Dict):
+        ...
+
+    @abstractmethod
+    def put_state(self, key: str, value):
+        ...
+
+    @abstractmethod
+    def save(self, metadata: Dict):
+        ...
+
+    def close(self):
+        pass
+
+
+class JsonMetadataStore(MetadataStore):
+    """A JSON checkpoint plus an append-only journal of per-file changes.
+
+    put_file/put_state append one compact line to ``<name>.journal`` and
+    return once it is fsync'ed. Concurrent writers share fsyncs (group
+    commit): whoever finds no commit in progress writes and syncs every
+    pending line, the others wait for it. save() and a journal longer than
+    checkpoint_entries rewrite the JSON file atomically and truncate the
+    journal; load() replays the journal over the last checkpoint, so
+    completed transfers survive a crash.
+    """
+
+    def __init__(self, path: str, checkpoint_entries: int = JOURNAL_CHECKPOINT_ENTRIES):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.checkpoint_entries = checkpoint_entries
+        self._cond = threading.Condition()
+        self._pending = []  # Journal lines not yet written
+        self._appended = 0  # Sequence number of the last appended line
+        self._durable = 0  # Sequence number of the last fsync'ed line
+        self._committing = False
+        self._journal = None
+        self._journal_entries = 0
+        self._state = {'drive_files': {}}  # Metadata other than 'files', as of the last save()
+        self._files = {}  # Current per-file entries, for checkpoints between saves
+
+    def load(self) -> Dict:
+        metadata = {'files': {}, 'drive_files': {}}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    metadata = json.load(f)
+            except json.JSONDecodeError:
+                print("⚠️  Metadata file corrupted, starting fresh")
+        metadata.setdefault('files', {})
+        replayed = self._replay(metadata)
+        self._files = dict(metadata['files'])
+        self._state = {key: value for key, value in metadata.items() if key != 'files'}
+        if replayed:
+            print(f"📒 Replayed {replayed} metadata journal entries")
+            with self._cond:
+                self._checkpoint()
+        return metadata
+
+    def _replay(self, metadata: Dict) -> int:
+        """Apply journal lines to metadata; a torn last line from a crash is ignored."""
+        if not os.path.exists(self.journal_path):
+            return 0
+        replayed = 0
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if record['op'] == 'put':
+                    metadata['files'][record['path']] = record['entry']
+                else:
+                    metadata[record['key']] = record['value']
+                replayed += 1
+        return replayed
+
+    def put_file(self, rel_path: str, entry: Dict):
+        self._append({'op': 'put', 'path': rel_path, 'entry': entry})
+
+    def put_state(self, key: str, value):
+        self._append({'op': 'state', 'key': key, 'value': value})
+
+    def _append(self, record: Dict):
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._cond:
+            if record['op'] == 'put':
+                self._files[record['path']] = record['entry']
+            else:
+                self._state[record['key']] = record['value']
+            self._pending.append(line)
+            self._appended += 1
+            seq = self._appended
+            while self._durable < seq:
+                if self._committing:
+                    self._cond.wait()
+                    continue
+                # Lead a commit for every line pending so far
+                self._committing = True
+                lines, self._pending = self._pending, []
+                upto = self._appended
+                committed = False
+                self._cond.release()
+                try:
+                    self._write_journal(lines)
+                    committed = True
+                finally:
+                    self._cond.acquire()
+                    self._committing = False
+                    self._cond.notify_all()
+                    if committed:
+                        self._durable = upto
+                        self._journal_entries += len(lines)
+                    else:
+                        self._pending[:0] = lines  # Let the next leader retry them
+            if self._journal_entries >= self.checkpoint_entries and not self._committing:
+                self._checkpoint()
+
+    def _write_journal(self, lines):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(''.join(lines))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def save(self, metadata: Dict):
+        with self._cond:
+            while self._committing:
+                self._cond.wait()
+            self._state = {key: value for key, value in metadata.items() if key != 'files'}
+            self._files = dict(metadata['files'])
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """Atomically rewrite the JSON file and start an empty journal (holding the lock)."""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({**self._state, 'files': self._files}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w')  # Truncate: everything is in the checkpoint
+        self._journal_entries = 0
+
+    def close(self):
+        with self._cond:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+
+class SqliteMetadataStore(MetadataStore):
+    """SQLite (WAL) store with one row per file, indexed by path and drive_id.
+
+    On first open, an existing JSON metadata file is imported and renamed to
+    ``<name>.migrated``.
+    """
+
+    def __init__(self, path: str, json_path: str = None):
+        self.path = path
+        self._lock = threading.Lock()  # One connection shared by worker threads
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, drive_id TEXT, data TEXT NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS files_drive_id ON files (drive_id)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+        if json_path and os.path.exists(json_path):
+            self._migrate_json(json_path)
+
+    def _migrate_json(self, json_path: str):
+        metadata = JsonMetadataStore(json_path).load()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO files (path, drive_id, data) VALUES (?, ?, ?)',
+                [(path, entry.get('drive_id'), json.dumps(entry))
+                 for path, entry in metadata.get('files', {}).items()]
+            )
+            self._save_state(metadata)
+        os.replace(json_path, json_path + '.migrated')
+        print(f"📦 Migrated {len(metadata.get('files', {}))} metadata entries from {json_path} to {self.path}")
+
+    def load(self) -> Dict:
+        with self._lock:
+            metadata = {key: json.loads(value)
+                        for key, value in self._conn.execute('SELECT key, value FROM state')}
+            metadata['files'] = {path: json.loads(data)
+                                 for path, data in self._conn.execute('SELECT path, data FROM files')}
+        metadata.setdefault('drive_files', {})
+        return metadata
+
+    def put_file(self, rel_path: str, entry: Dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (path, drive_id, data) VALUES (?, ?, ?)',
+                (rel_path, entry.get('drive_id'), json.dumps(entry))
+            )
+
+    def put_state(self, key: str, value):
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+                               (key, json.dumps(value)))
+
+    def save(self, metadata: Dict):
+        # File rows are already up to date; only the small state keys change here
+        with self._lock, self._conn:
+            self._save_state(metadata)
+
+    def _save_state(self, metadata: Dict):
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)',
+            [(key, json.dumps(value)) for key, value in metadata.items() if key != 'files']
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_metadata_store(backend: str, json_path: str, db_path: str) -> MetadataStore:
+    """Create the metadata store selected by backend ('sqlite' or 'json')."""
+    if backend == 'sqlite':
+        return SqliteMetadataStore(db_path, json_path=json_path)
+    if backend == 'json':
+        return JsonMetadataStore(json_path)
+    raise ValueError(f"Unknown metadata backend: {backend}")
@@ -0,0 +1,157 @@
+import time
+import random
+import threading
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+from googleapiclient.errors import HttpError
+
+T = TypeVar('T')
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = ('ratelimitexceeded', 'userratelimitexceeded')  # 403 reasons meaning "slow down"
+
+
+class AdaptiveRateLimiter:
+    """Central gate for Drive API calls.
+
+    A token bucket caps queries per second and an AIMD window caps how many
+    calls are in flight: every success grows the window by 1/window (about +1
+    per round of calls), every throttle response (429, 403 rate limit) halves
+    both the window and the rate, and other failures leave both unchanged.
+    Throttled and transient failures are retried with full-jitter
+    exponential backoff, honouring Retry-After.
+    """
+
+    def __init__(self, max_qps: float, max_concurrency: int, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 64.0, min_qps: float = 0.5):
+        self.max_qps = max_qps
+        self.min_qps = min_qps
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.qps = float(max_qps)
+        self.concurrency_limit = float(max_concurrency)
+        self._tokens = float(max_qps)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._paused_until = 0.0  # Retry-After applies to every caller
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def call(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run fn under the limiter, retrying throttled and transient failures."""
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable, throttled, retry_after = self.classify(e)
+                self._release(throttled=throttled)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt, retry_after))
+                attempt += 1
+                continue
+            self._release(succeeded=True)
+            return result
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff for a retry; Retry-After pauses every caller."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        with self._cond:
+            self.retries += 1
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        return delay
+
+    def throttle(self):
+        """Record a throttle response that did not come through call() (e.g. a batch item)."""
+        with self._cond:
+            self._throttle()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """Current rate, concurrency window and throttle counters."""
+        with self._cond:
+            return {
+                'qps': round(self.qps, 2),
+                'concurrency_limit': round(self.concurrency_limit, 2),
+                'in_flight': self._in_flight,
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'retries': self.retries,
+            }
+
+    def _refill(self, now: float):
+        self._tokens = min(self.qps, self._tokens + (now - self._last_refill) * self.qps)
+        self._last_refill = now
+
+    def _acquire(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self._in_flight >= max(1, int(self.concurrency_limit)):
+                    timeout = None  # Woken by _release
+                elif self._tokens < 1:
+                    timeout = (1 - self._tokens) / self.qps
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self.calls += 1
+                    return
+                self._cond.wait(timeout)
+
+    def _release(self, succeeded: bool = False, throttled: bool = False):
+        """Free an in-flight slot; only successes grow the window and the rate."""
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self._throttle()
+            elif succeeded:
+                self.concurrency_limit = min(self.max_concurrency,
+                                             self.concurrency_limit + 1 / self.concurrency_limit)
+                self.qps = min(self.max_qps, self.qps + 1 / self.qps)
+            self._cond.notify_all()
+
+    def _throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        # Calls already in flight fail together; back off once per burst
+        if now - self._last_decrease > 1.0:
+            self._last_decrease = now
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            self.qps = max(self.min_qps, self.qps / 2)
+            self._tokens = min(self._tokens, self.qps)
+
+    @staticmethod
+    def classify(error: Exception) -> Tuple[bool, bool, Optional[float]]:
+        """Return (retryable, throttled, retry_after_seconds) for an exception."""
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            retry_after = None
+            header = error.resp.get('retry-after')
+            if header:
+                try:
+                    retry_after = float(header)
+                except ValueError:
+                    pass
+            if status == 403:
+                content = error.content.decode('utf-8', 'ignore').lower() if error.content else ''
+                throttled = any(reason in content for reason in RATE_LIMIT_REASONS)
+                return throttled, throttled, retry_after
+            if status in RETRYABLE_STATUSES:
+                return True, status == 429, retry_after
+            return False, False, None
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True, False, None
+        return False, False, None